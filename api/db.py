@@ -0,0 +1,215 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Iterator, Optional, Sequence
+
+# Прагмы для всех соединений: WAL позволяет читателям не ждать писателя,
+# synchronous=NORMAL в WAL-режиме не теряет целостность при сбое процесса
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+)
+
+
+def connect(
+    path: str,
+    cache_size_kib: int = 16384,
+    busy_timeout: float = 30.0,
+    cached_statements: int = 256,
+    isolation_level: Optional[str] = "",
+) -> sqlite3.Connection:
+    db = sqlite3.connect(
+        path,
+        timeout=busy_timeout,
+        check_same_thread=False,
+        cached_statements=cached_statements,
+        isolation_level=isolation_level,
+    )
+    for pragma in PRAGMAS:
+        db.execute(pragma)
+    db.execute(f"PRAGMA cache_size=-{int(cache_size_kib)}")
+    return db
+
+
+class ConnectionPool:
+    """Ограниченный пул соединений SQLite.
+
+    Соединение выдаётся одному потоку на время connection(); sqlite3 кэширует
+    подготовленные выражения на соединение (cached_statements), поэтому
+    повторяющиеся запросы не компилируются заново.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        size: int = 8,
+        acquire_timeout: float = 30.0,
+        **connect_kwargs,
+    ):
+        self.path = path
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self._connect_kwargs = connect_kwargs
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return connect(self.path, **self._connect_kwargs)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise TimeoutError("Нет свободных соединений с базой данных")
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Соединение на одну единицу работы: commit при успехе, rollback при ошибке."""
+        db = self._acquire()
+        try:
+            yield db
+            if db.in_transaction:
+                db.commit()
+        except BaseException:
+            if db.in_transaction:
+                db.rollback()
+            raise
+        finally:
+            self._idle.put(db)
+
+    def in_use(self) -> int:
+        return self._created - self._idle.qsize()
+
+    def stats(self) -> dict:
+        return {"size": self.size, "created": self._created, "idle": self._idle.qsize()}
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class WriteBatcher:
+    """Групповые коммиты: записи из разных запросов, пришедшие пока шёл
+    предыдущий коммит, фиксируются одной транзакцией (до max_batch штук;
+    max_delay > 0 позволяет подождать ещё записей ценой задержки).
+
+    Каждая запись выполняется в своей точке сохранения, так что ошибка одной
+    не откатывает остальные. submit() возвращает Future с lastrowid.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_batch: int = 256,
+        max_delay: float = 0.0,
+        **connect_kwargs,
+    ):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._db = connect(path, isolation_level=None, **connect_kwargs)
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self.batches = 0
+        self.writes = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, sql: str, params: Sequence = ()) -> Future:
+        future: Future = Future()
+        self._queue.put((sql, params, future))
+        return future
+
+    def execute(self, sql: str, params: Sequence = ()) -> int:
+        return self.submit(sql, params).result()
+
+    def _collect(self, first: tuple) -> list:
+        # Забираем всё, что накопилось, пока шёл предыдущий коммит;
+        # при max_delay > 0 дополнительно ждём попутчиков до дедлайна
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = self._collect(first)
+            try:
+                self._commit(batch)
+            except Exception as e:
+                logging.error(f"Ошибка группового коммита: {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+        self._db.close()
+
+    def _commit(self, batch: list) -> None:
+        db = self._db
+        results = []
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params, future in batch:
+                db.execute("SAVEPOINT write")
+                try:
+                    cursor = db.execute(sql, params)
+                except sqlite3.Error as e:
+                    db.execute("ROLLBACK TO write")
+                    results.append((future, None, e))
+                else:
+                    results.append((future, cursor.lastrowid, None))
+                db.execute("RELEASE write")
+            db.execute("COMMIT")
+        except BaseException:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
+        self.batches += 1
+        self.writes += len(batch)
+        for future, lastrowid, error in results:
+            if error is None:
+                future.set_result(lastrowid)
+            else:
+                future.set_exception(error)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
@@ -2,4 +2,10 @@ import fastapi
 
 
 def get_db_connection(request: fastapi.Request):
-    return request.app.state.db
+    # Соединение из пула на время запроса, commit/rollback по его итогу
+    with request.app.state.db.connection() as db:
+        yield db
+
+
+def get_db_writer(request: fastapi.Request):
+    return request.app.state.db_writer
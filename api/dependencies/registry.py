@@ -0,0 +1,5 @@
+import fastapi
+
+
+def get_registry(request: fastapi.Request):
+    return request.app.state.registry
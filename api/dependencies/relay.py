@@ -0,0 +1,5 @@
+import fastapi
+
+
+def get_relay(request: fastapi.Request):
+    return request.app.state.relay
@@ -1,6 +1,5 @@
 import logging
 import os
-import sqlite3
 import uvicorn
 import dynaconf
 from routers.register import router_register
@@ -8,16 +7,49 @@ from routers.message import message_router
 
 from fastapi import FastAPI
 
+from db import ConnectionPool, WriteBatcher
+from metrics import observe_pool
+import metrics
+import tracing
 from migrations import migrate
+from registry import Registry
+from relay import Relay
 
-db = sqlite3.connect("data.db")
+conf = dynaconf.Dynaconf(settings_files="config.toml")
 logging.basicConfig(level=0)
 
-migrate(db)
+db_path = conf.get("db.path", "data.db")
+db = ConnectionPool(db_path, size=conf.get("db.pool_size", 8))
+with db.connection() as connection:
+    migrate(connection)
+observe_pool("db_connections", db.in_use, db.size)
+db_writer = WriteBatcher(
+    db_path,
+    max_batch=conf.get("db.batch_size", 256),
+    max_delay=conf.get("db.batch_delay", 0.0),
+)
+registry = Registry(
+    db, db_writer, heartbeat_ttl=conf.get("registry.heartbeat_ttl", 30.0)
+)
+registry.load()
+relay = Relay(
+    db,
+    db_writer,
+    workers=conf.get("relay.workers", 8),
+    max_attempts=conf.get("relay.max_attempts", 8),
+    resolve=registry.url,
+    known=registry.known,
+    registered_only=conf.get("relay.registered_only", False),
+)
+relay.recover()
 
 app = FastAPI()
-conf = dynaconf.Dynaconf(settings_files="config.toml")
+metrics.instrument(app)
+tracing.instrument(app, "api")
 app.state.db = db
+app.state.db_writer = db_writer
+app.state.relay = relay
+app.state.registry = registry
 app.include_router(router_register, tags=["register"])
 app.include_router(message_router, tags=["message"])
 
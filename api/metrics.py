@@ -0,0 +1,152 @@
+import itertools
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, List, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Gauge, Histogram, generate_latest
+
+# Границы корзин гистограмм по умолчанию, секунды
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки входящего HTTP-запроса",
+    ("method", "route", "status"),
+    buckets=DEFAULT_BUCKETS,
+)
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    "upstream_request_duration_seconds",
+    "Время исходящего HTTP-запроса к соседнему сервису",
+    ("upstream", "method", "status"),
+    buckets=DEFAULT_BUCKETS,
+)
+KEYGEN_SECONDS = Histogram(
+    "keygen_duration_seconds",
+    "Время генерации пары ключей RSA",
+    ("bits",),
+    buckets=DEFAULT_BUCKETS,
+)
+SIGN_SECONDS = Histogram(
+    "sign_duration_seconds", "Время вычисления подписи", buckets=DEFAULT_BUCKETS
+)
+VERIFY_SECONDS = Histogram(
+    "verify_duration_seconds",
+    "Время проверки подписи (каждый METRICS_SAMPLE_EVERY-й вызов)",
+    buckets=DEFAULT_BUCKETS,
+)
+# Время custom_hash и проверки подписи замеряется у каждого N-го вызова:
+# на коротких входах сам замер дороже работы
+METRICS_SAMPLE_EVERY = max(1, int(os.getenv("METRICS_SAMPLE_EVERY", "64")))
+# Размер входа в символах, округлённый вверх до степени 4
+HASH_SIZE_CLASSES = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+HASH_SECONDS = Histogram(
+    "hash_duration_seconds",
+    "Время custom_hash по размеру входа (каждый METRICS_SAMPLE_EVERY-й вызов)",
+    ("size",),
+    buckets=DEFAULT_BUCKETS,
+)
+CERT_STORE_IO_SECONDS = Histogram(
+    "cert_store_io_seconds",
+    "Время файловых операций хранилища сертификатов",
+    ("op",),
+    buckets=DEFAULT_BUCKETS,
+)
+POOL_SATURATION = Gauge(
+    "pool_saturation",
+    "Заполненность пулов потоков, процессов и соединений (занято / всего)",
+    ("pool",),
+)
+
+_hash_labels = [f"le_{size}" for size in HASH_SIZE_CLASSES] + [
+    f"gt_{HASH_SIZE_CLASSES[-1]}"
+]
+_hash_children: List[Optional[Histogram]] = [None] * len(_hash_labels)
+
+
+def sampler(every: int = METRICS_SAMPLE_EVERY) -> Callable[[], bool]:
+    """Функция, которая возвращает True на каждый every-й вызов."""
+    return itertools.cycle((True,) + (False,) * (every - 1)).__next__
+
+
+def observe_hash(size: int, seconds: float) -> None:
+    index = bisect_left(HASH_SIZE_CLASSES, size)
+    child = _hash_children[index]
+    if child is None:
+        child = _hash_children[index] = HASH_SECONDS.labels(_hash_labels[index])
+    child.observe(seconds)
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: гистограмма времени ответа по шаблону маршрута.
+
+    Маршрут берётся из scope после сопоставления (/issued_certs/{serial},
+    а не конкретный URL), чтобы число рядов не росло с числом запросов.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                scope["method"], getattr(route, "path", "unmatched"), status[0]
+            ).observe(time.perf_counter() - start)
+
+
+def instrument(app) -> None:
+    """Подключает middleware и эндпоинт /metrics к приложению FastAPI."""
+    from anyio import to_thread
+    from fastapi.responses import Response
+
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+    @app.on_event("startup")
+    async def observe_threadpool():
+        # Пул потоков AnyIO, в котором выполняются все синхронные эндпоинты.
+        # Лимитер привязан к циклу событий, поэтому берётся здесь, а читать
+        # его счётчики при сборе можно из любого потока
+        limiter = to_thread.current_default_thread_limiter()
+        POOL_SATURATION.labels("threadpool").set_function(
+            lambda: limiter.borrowed_tokens / limiter.total_tokens
+        )
+
+
+def observe_pool(name: str, used: Callable[[], float], total: Optional[float]) -> None:
+    """Регистрирует заполненность пула, вычисляемую только при сборе метрик."""
+    if total:
+        POOL_SATURATION.labels(name).set_function(lambda: used() / total)
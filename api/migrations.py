@@ -12,6 +12,8 @@ def migrate(db: sqlite3.Connection):
 
     migrations = os.listdir("migrations")
     migrations.remove("init.sql")
+    # Порядок важен: индексы и таблицы из поздних миграций зависят от ранних
+    migrations.sort(key=lambda m: m.split(".")[0].zfill(20))
     for m in migrations:
         n = m.split(".")[0]
         try:
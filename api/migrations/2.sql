@@ -0,0 +1,12 @@
+CREATE TABLE IF NOT EXISTS relay_messages(
+    id INTEGER PRIMARY KEY,
+    recipient VARCHAR(50) NOT NULL,
+    payload TEXT NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    delivered_at REAL,
+    response_status INT,
+    last_error TEXT
+)
\ No newline at end of file
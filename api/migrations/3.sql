@@ -0,0 +1 @@
+CREATE INDEX IF NOT EXISTS relay_messages_pending ON relay_messages(status, id)
\ No newline at end of file
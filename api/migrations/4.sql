@@ -0,0 +1 @@
+CREATE UNIQUE INDEX IF NOT EXISTS data_centers_name ON data_centers(name)
\ No newline at end of file
@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS clients(
+    name VARCHAR(50) PRIMARY KEY,
+    host VARCHAR(50) NOT NULL,
+    port INT NOT NULL,
+    ca VARCHAR(50),
+    last_heartbeat REAL NOT NULL DEFAULT 0
+)
\ No newline at end of file
@@ -0,0 +1,143 @@
+import threading
+import time
+from typing import Dict, List, Optional
+
+from db import ConnectionPool, WriteBatcher
+from relay import recipient_url
+
+
+class Registry:
+    """Реестр клиентов и УЦ для service discovery.
+
+    УЦ хранятся в data_centers (name/host/port), клиенты — в clients
+    с привязкой к УЦ и временем последнего heartbeat. Чтения обслуживаются
+    из индекса в памяти, записи сквозные: сначала индекс, затем база
+    через групповой коммит.
+    """
+
+    def __init__(
+        self,
+        db: ConnectionPool,
+        writer: WriteBatcher,
+        heartbeat_ttl: float = 30.0,
+    ):
+        self.db = db
+        self.writer = writer
+        self.heartbeat_ttl = heartbeat_ttl
+        self._data_centers: Dict[str, dict] = {}
+        self._clients: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        with self.db.connection() as db:
+            data_centers = db.execute("SELECT name, host, port FROM data_centers")
+            clients = db.execute(
+                "SELECT name, host, port, ca, last_heartbeat FROM clients"
+            ).fetchall()
+            data_centers = data_centers.fetchall()
+        with self._lock:
+            self._data_centers = {
+                name: {"name": name, "host": host, "port": port}
+                for name, host, port in data_centers
+            }
+            self._clients = {
+                name: {
+                    "name": name,
+                    "host": host,
+                    "port": port,
+                    "ca": ca,
+                    "last_heartbeat": last_heartbeat,
+                }
+                for name, host, port, ca, last_heartbeat in clients
+            }
+
+    def register_ca(self, name: str, host: str, port: int) -> dict:
+        entry = {"name": name, "host": host, "port": port}
+        with self._lock:
+            self._data_centers[name] = entry
+        self.writer.execute(
+            "INSERT INTO data_centers(name, host, port) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET host = excluded.host, port = excluded.port",
+            (name, host, port),
+        )
+        return entry
+
+    def register_client(
+        self, name: str, host: str, port: int, ca: Optional[str]
+    ) -> dict:
+        entry = {
+            "name": name,
+            "host": host,
+            "port": port,
+            "ca": ca,
+            "last_heartbeat": time.time(),
+        }
+        with self._lock:
+            self._clients[name] = entry
+        self.writer.execute(
+            "INSERT INTO clients(name, host, port, ca, last_heartbeat) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT(name) DO UPDATE SET "
+            "host = excluded.host, port = excluded.port, ca = excluded.ca, "
+            "last_heartbeat = excluded.last_heartbeat",
+            (name, host, port, ca, entry["last_heartbeat"]),
+        )
+        return entry
+
+    def heartbeat(self, name: str) -> bool:
+        now = time.time()
+        with self._lock:
+            entry = self._clients.get(name)
+            if entry is None:
+                return False
+            entry["last_heartbeat"] = now
+        # Heartbeat не ждёт коммита: потеря последнего значения некритична
+        self.writer.submit(
+            "UPDATE clients SET last_heartbeat = ? WHERE name = ?", (now, name)
+        )
+        return True
+
+    def _alive(self, entry: dict, now: float) -> bool:
+        return now - entry["last_heartbeat"] <= self.heartbeat_ttl
+
+    def resolve(self, name: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            data_center = self._data_centers.get(name)
+            if data_center is not None:
+                return {**data_center, "kind": "ca"}
+            entry = self._clients.get(name)
+            if entry is None:
+                return None
+            ca = self._data_centers.get(entry["ca"]) if entry["ca"] else None
+            return {
+                **entry,
+                "kind": "client",
+                "alive": self._alive(entry, now),
+                "data_center": ca,
+            }
+
+    def clients(self, ca: Optional[str] = None, alive_only: bool = True) -> List[dict]:
+        now = time.time()
+        with self._lock:
+            return [
+                {**entry, "alive": self._alive(entry, now)}
+                for entry in self._clients.values()
+                if (ca is None or entry["ca"] == ca)
+                and (not alive_only or self._alive(entry, now))
+            ]
+
+    def data_centers(self) -> List[dict]:
+        with self._lock:
+            return list(self._data_centers.values())
+
+    def known(self, name: str) -> bool:
+        with self._lock:
+            return name in self._clients or name in self._data_centers
+
+    def url(self, name: str) -> str:
+        """Базовый URL сервиса; незарегистрированные — по имени в сети compose."""
+        with self._lock:
+            entry = self._clients.get(name) or self._data_centers.get(name)
+            if entry is None:
+                return recipient_url(name)
+            return f"http://{entry['host']}:{entry['port']}"
@@ -0,0 +1,295 @@
+import json
+import logging
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from db import ConnectionPool, WriteBatcher
+from metrics import UPSTREAM_REQUEST_SECONDS, observe_pool
+from tracing import outgoing_headers, start_trace
+
+RELAY_PATH = "/message/get_message"
+# Ответы 4xx, после которых доставку стоит повторить
+RETRY_CLIENT_ERRORS = (408, 429)
+# Допустимое имя получателя: имя сервиса или хоста, без схемы, порта и пути
+RECIPIENT_NAME = re.compile(r"^[A-Za-z0-9_.-]+$")
+# Метка метрик для получателей вне реестра, чтобы число серий было ограничено
+UNREGISTERED_LABEL = "unregistered"
+
+
+class UnknownRecipient(LookupError):
+    """Получатель не зарегистрирован, а ретранслятор принимает только известных."""
+
+
+def check_recipient(recipient: str) -> str:
+    if not RECIPIENT_NAME.fullmatch(recipient):
+        raise ValueError(f"Недопустимое имя получателя: {recipient!r}")
+    return recipient
+
+
+def recipient_url(recipient: str) -> str:
+    # Получатель — имя сервиса клиента в сети docker-compose (client1, ...)
+    return f"http://{check_recipient(recipient)}:8000"
+
+
+class Relay:
+    """Store-and-forward доставка сообщений между клиентами.
+
+    Сообщение сначала сохраняется в relay_messages (групповым коммитом),
+    затем доставляется в фоне. У каждого получателя своя очередь: сообщения
+    ему уходят по порядку, а недоступный получатель ждёт повтора
+    с экспоненциальной задержкой, не задерживая остальных.
+    Имя получателя проверяется при приёме: адрес строится из него,
+    поэтому схема, порт или путь в имени не допускаются. С registered_only
+    принимаются только получатели из реестра (known).
+    Доставленным считается только ответ 2xx. Остальные 4xx (отозванный
+    или неизвестный сертификат, неверное сообщение) — отказ получателя:
+    сообщение помечается rejected с кодом ответа и не повторяется.
+    """
+
+    def __init__(
+        self,
+        db: ConnectionPool,
+        writer: WriteBatcher,
+        workers: int = 8,
+        max_attempts: int = 8,
+        base_delay: float = 0.5,
+        max_delay: float = 60.0,
+        timeout: float = 10.0,
+        resolve: Callable[[str], str] = recipient_url,
+        known: Callable[[str], bool] = lambda recipient: False,
+        registered_only: bool = False,
+    ):
+        self.db = db
+        self.writer = writer
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.resolve = resolve
+        self.known = known
+        self.registered_only = registered_only
+        self._queues: Dict[str, Deque[int]] = {}
+        self._active: set = set()
+        self._timers: Dict[str, threading.Timer] = {}
+        # Подряд идущие сбои очереди получателя (ошибки базы), для задержки
+        self._errors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._closed = False
+        observe_pool("relay_workers", lambda: len(self._active), workers)
+
+    def recover(self) -> int:
+        """Ставит в очереди недоставленные сообщения после перезапуска."""
+        with self.db.connection() as db:
+            rows = db.execute(
+                "SELECT id, recipient FROM relay_messages "
+                "WHERE status = 'pending' ORDER BY id"
+            ).fetchall()
+        for message_id, recipient in rows:
+            self._enqueue(recipient, message_id)
+        return len(rows)
+
+    def submit(self, recipient: str, payload: dict) -> int:
+        check_recipient(recipient)
+        if self.registered_only and not self.known(recipient):
+            raise UnknownRecipient(recipient)
+        message_id = self.writer.execute(
+            "INSERT INTO relay_messages(recipient, payload, created_at) "
+            "VALUES (?, ?, ?)",
+            (recipient, json.dumps(payload), time.time()),
+        )
+        self._enqueue(recipient, message_id)
+        return message_id
+
+    def status(self, message_id: int) -> Optional[dict]:
+        with self.db.connection() as db:
+            row = db.execute(
+                "SELECT id, recipient, status, attempts, created_at, delivered_at, "
+                "response_status, last_error FROM relay_messages WHERE id = ?",
+                (message_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = (
+            "id",
+            "recipient",
+            "status",
+            "attempts",
+            "created_at",
+            "delivered_at",
+            "response_status",
+            "last_error",
+        )
+        return dict(zip(keys, row))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queues": {r: len(q) for r, q in self._queues.items() if q},
+                "active": len(self._active),
+                "waiting_retry": len(self._timers),
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _enqueue(self, recipient: str, message_id: int) -> None:
+        with self._lock:
+            self._queues.setdefault(recipient, deque()).append(message_id)
+            if recipient in self._active or self._closed:
+                return
+            self._active.add(recipient)
+        self._executor.submit(self._drain, recipient)
+
+    def _resume(self, recipient: str) -> None:
+        with self._lock:
+            self._timers.pop(recipient, None)
+            if self._closed:
+                return
+        self._executor.submit(self._drain, recipient)
+
+    def _load(self, message_id: int) -> Optional[Tuple[str, str, int, float]]:
+        with self.db.connection() as db:
+            return db.execute(
+                "SELECT payload, status, attempts, next_attempt_at "
+                "FROM relay_messages WHERE id = ?",
+                (message_id,),
+            ).fetchone()
+
+    def _schedule(self, recipient: str, delay: float) -> None:
+        # Получатель остаётся активным, очередь продолжится по таймеру
+        timer = threading.Timer(delay, self._resume, (recipient,))
+        timer.daemon = True
+        with self._lock:
+            if self._closed:
+                self._active.discard(recipient)
+                return
+            self._timers[recipient] = timer
+        timer.start()
+
+    def _drain(self, recipient: str) -> None:
+        try:
+            self._drain_queue(recipient)
+        except Exception as e:
+            # Ошибка базы не должна останавливать очередь: сообщение осталось
+            # pending, поэтому очередь просто повторяется с задержкой
+            with self._lock:
+                errors = self._errors.get(recipient, 0) + 1
+                self._errors[recipient] = errors
+            delay = min(self.max_delay, self.base_delay * 2 ** (errors - 1))
+            logging.error(
+                f"Ошибка очереди ретранслятора для {recipient}: {e!r}, "
+                f"повтор через {delay:.1f} с"
+            )
+            self._schedule(recipient, delay)
+        else:
+            with self._lock:
+                self._errors.pop(recipient, None)
+
+    def _drain_queue(self, recipient: str) -> None:
+        while True:
+            with self._lock:
+                queue = self._queues.get(recipient)
+                if not queue or self._closed:
+                    self._active.discard(recipient)
+                    return
+                message_id = queue[0]
+
+            row = self._load(message_id)
+            if row is None or row[1] != "pending":
+                with self._lock:
+                    queue.popleft()
+                continue
+            payload, _, attempts, next_attempt_at = row
+
+            delay = next_attempt_at - time.time()
+            if delay > 0:
+                self._schedule(recipient, delay)
+                return
+
+            status_code, error = self._deliver(recipient, payload)
+            attempts += 1
+            if status_code is not None and 200 <= status_code < 300:
+                self.writer.execute(
+                    "UPDATE relay_messages SET status = 'delivered', attempts = ?, "
+                    "delivered_at = ?, response_status = ?, last_error = NULL "
+                    "WHERE id = ?",
+                    (attempts, time.time(), status_code, message_id),
+                )
+                with self._lock:
+                    queue.popleft()
+            elif (
+                status_code is not None
+                and status_code < 500
+                and status_code not in RETRY_CLIENT_ERRORS
+            ):
+                logging.warning(
+                    f"Получатель {recipient} отклонил сообщение {message_id}: {error}"
+                )
+                self.writer.execute(
+                    "UPDATE relay_messages SET status = 'rejected', attempts = ?, "
+                    "response_status = ?, last_error = ? WHERE id = ?",
+                    (attempts, status_code, error, message_id),
+                )
+                with self._lock:
+                    queue.popleft()
+            elif attempts >= self.max_attempts:
+                logging.error(
+                    f"Сообщение {message_id} для {recipient} не доставлено: {error}"
+                )
+                self.writer.execute(
+                    "UPDATE relay_messages SET status = 'failed', attempts = ?, "
+                    "response_status = ?, last_error = ? WHERE id = ?",
+                    (attempts, status_code, error, message_id),
+                )
+                with self._lock:
+                    queue.popleft()
+            else:
+                backoff = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+                self.writer.execute(
+                    "UPDATE relay_messages SET attempts = ?, next_attempt_at = ?, "
+                    "response_status = ?, last_error = ? WHERE id = ?",
+                    (attempts, time.time() + backoff, status_code, error, message_id),
+                )
+
+    def _deliver(self, recipient: str, payload: str) -> Tuple[Optional[int], str]:
+        # Доставка идёт в фоне, вне запроса, поэтому у неё своя трасса
+        with start_trace("relay.deliver", recipient=recipient) as trace:
+            start = time.perf_counter()
+            try:
+                request = urllib.request.Request(
+                    self.resolve(recipient) + RELAY_PATH,
+                    data=payload.encode(),
+                    headers=outgoing_headers({"Content-Type": "application/json"}),
+                    method="POST",
+                )
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    result = response.status, ""
+            except urllib.error.HTTPError as e:
+                # Тело ответа объясняет отказ (например, "check" получателя)
+                detail = e.read(200).decode(errors="replace")
+                result = e.code, f"HTTP {e.code}: {detail}"
+            except (urllib.error.URLError, OSError) as e:
+                result = None, str(e)
+            except Exception as e:
+                # Неверный адрес (InvalidURL, ValueError) — тоже неудачная
+                # попытка: после max_attempts сообщение станет failed
+                result = None, f"{type(e).__name__}: {e}"
+            trace.set("status", result[0])
+        status = result[0] or "error"
+        label = recipient if self.known(recipient) else UNREGISTERED_LABEL
+        UPSTREAM_REQUEST_SECONDS.labels(label, "POST", status).observe(
+            time.perf_counter() - start
+        )
+        return result
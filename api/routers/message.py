@@ -1,11 +1,37 @@
 import logging
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
 
-from dependencies.db_connection import get_db_connection
+from dependencies.relay import get_relay
+from relay import RECIPIENT_NAME, UnknownRecipient
 
 message_router = APIRouter(prefix="/message")
 
 
-@message_router.post("/proccess_message")
-def proccess_message(db=Depends(get_db_connection)):
-    logging.info("крууууто")
+class RelayMessage(BaseModel):
+    recipient: str = Field(pattern=RECIPIENT_NAME.pattern)
+    payload: dict
+
+
+@message_router.post("/proccess_message", status_code=202)
+def proccess_message(msg: RelayMessage, relay=Depends(get_relay)):
+    # Сообщение сохраняется и доставляется получателю в фоне
+    try:
+        message_id = relay.submit(msg.recipient, msg.payload)
+    except UnknownRecipient:
+        raise HTTPException(status_code=404, detail="Получатель не зарегистрирован")
+    logging.info(f"Сообщение {message_id} для {msg.recipient} принято к доставке")
+    return {"id": message_id, "status": "pending"}
+
+
+@message_router.get("/status/{message_id}")
+def message_status(message_id: int, relay=Depends(get_relay)):
+    status = relay.status(message_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Сообщение не найдено")
+    return status
+
+
+@message_router.get("/relay_stats")
+def relay_stats(relay=Depends(get_relay)):
+    return relay.stats()
@@ -1,10 +1,65 @@
 import logging
-from fastapi import APIRouter
+from typing import Optional
 
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+
+from dependencies.registry import get_registry
+from relay import RECIPIENT_NAME
 
 router_register = APIRouter(prefix="/register")
 
 
+# Адрес сервиса строится из host и port, поэтому в них только имя хоста и номер
+class ClientRegistration(BaseModel):
+    name: str = Field(pattern=RECIPIENT_NAME.pattern)
+    host: str = Field(pattern=RECIPIENT_NAME.pattern)
+    port: int = Field(8000, ge=1, le=65535)
+    ca: Optional[str] = None
+
+
+class CARegistration(BaseModel):
+    name: str = Field(pattern=RECIPIENT_NAME.pattern)
+    host: str = Field(pattern=RECIPIENT_NAME.pattern)
+    port: int = Field(8001, ge=1, le=65535)
+
+
 @router_register.post("/client")
-def register():
-    logging.info("Даааа кайфуем")
+def register(client: ClientRegistration, registry=Depends(get_registry)):
+    entry = registry.register_client(client.name, client.host, client.port, client.ca)
+    logging.info(f"Клиент {client.name} зарегистрирован ({client.host}:{client.port})")
+    return entry
+
+
+@router_register.post("/ca")
+def register_ca(ca: CARegistration, registry=Depends(get_registry)):
+    entry = registry.register_ca(ca.name, ca.host, ca.port)
+    logging.info(f"УЦ {ca.name} зарегистрирован ({ca.host}:{ca.port})")
+    return entry
+
+
+@router_register.post("/heartbeat/{name}")
+def heartbeat(name: str, registry=Depends(get_registry)):
+    if not registry.heartbeat(name):
+        raise HTTPException(status_code=404, detail="Клиент не зарегистрирован")
+    return {"status": "ok"}
+
+
+@router_register.get("/resolve/{name}")
+def resolve(name: str, registry=Depends(get_registry)):
+    entry = registry.resolve(name)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Сервис не найден")
+    return entry
+
+
+@router_register.get("/clients")
+def clients(
+    ca: Optional[str] = None, alive_only: bool = True, registry=Depends(get_registry)
+):
+    return registry.clients(ca=ca, alive_only=alive_only)
+
+
+@router_register.get("/data_centers")
+def data_centers(registry=Depends(get_registry)):
+    return registry.data_centers()
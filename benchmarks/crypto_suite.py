@@ -0,0 +1,300 @@
+"""Набор микробенчмарков криптографии клиента с проверкой регрессий.
+
+Замеряет generate_prime, generate_keys, custom_hash (16 Б – 1 МБ), подпись
+pow(r, d, n), check_signature, проверку цепочки как в generate_keys_usecase
+и разбор IncomingMessage. Результат — JSON со временем одной операции.
+
+Запуск из корня репозитория:
+    python benchmarks/crypto_suite.py --output results.json
+    python benchmarks/crypto_suite.py --bits 64 512 --filter sign
+    python benchmarks/crypto_suite.py --compare benchmarks/baseline.json
+
+В режиме --compare скрипт завершается с кодом 1, если хотя бы одна метрика
+стала медленнее базовой больше чем на --threshold (доля, 0.3 = +30%).
+Базовые значения зависят от машины: сравнивайте с базой, снятой на ней же
+(python benchmarks/crypto_suite.py --output benchmarks/baseline.json).
+Если python, архитектура или параметры замера (--seconds, --repeats,
+--min-rounds) отличаются от meta базы, --compare завершается с ошибкой;
+--allow-meta-mismatch сравнивает всё равно, с предупреждением. Метрики
+custom_hash/{бит}/{размер} несут размер ключа в имени, поэтому запуск с
+другим --bits просто не найдёт их в базе.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "client"))
+
+from cert import (  # noqa: E402
+    ClientCertificate,
+    IntermediateCertificate,
+    RootCertificate,
+)
+from usecases.crypto_utils import (  # noqa: E402
+    check_signature,
+    construct_data_str,
+    custom_hash,
+    generate_keys,
+    generate_prime,
+)
+from usecases.dtos import IncomingMessage, Signature  # noqa: E402
+
+DEFAULT_BITS = [64, 512, 1024]
+# Метрики со случайным временем одной операции
+RANDOMIZED = ("generate_prime/", "generate_keys/")
+HASH_SIZES = [16, 256, 4096, 65536, 1048576]
+TIMESTAMP = 1700000000
+
+
+def measure(fn: Callable[[], object], seconds: float, repeats: int) -> dict:
+    """Лучшее время одной операции из repeats серий по ~seconds каждая."""
+    fn()
+    best = float("inf")
+    rounds = 0
+    for _ in range(repeats):
+        count = 0
+        start = time.perf_counter()
+        while True:
+            fn()
+            count += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= seconds:
+                break
+        rounds += count
+        best = min(best, elapsed / count)
+    return {"per_op_s": best, "ops_per_s": 1 / best, "rounds": rounds}
+
+
+def measure_mean(fn: Callable[[], object], seconds: float, min_rounds: int) -> dict:
+    """Среднее время операции со случайной длительностью (поиск простых).
+
+    Минимум по сериям здесь показал бы удачную генерацию, а не типичную,
+    поэтому усредняется не меньше min_rounds вызовов.
+    """
+    count = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds and count >= min_rounds:
+            break
+    return {"per_op_s": elapsed / count, "ops_per_s": count / elapsed, "rounds": count}
+
+
+def sign(subject: str, public_key: List[int], n: int, d: int) -> dict:
+    r = custom_hash(construct_data_str(subject, public_key, TIMESTAMP), n)
+    return {"r": r, "s": pow(r, d, n)}
+
+
+def make_chain(bits: int) -> dict:
+    """Цепочка Root → ICA → клиент в формате ответов УЦ."""
+    _, _, root_n, root_e, root_d = generate_keys(bits)
+    _, _, ica_n, ica_e, ica_d = generate_keys(bits)
+    _, _, n, e, d = generate_keys(bits)
+    root = {
+        "subject": "Root CA",
+        "issuer": "Root CA",
+        "public_key": [root_e, root_n],
+        "timestamp": TIMESTAMP,
+        "signature": sign("Root CA", [root_e, root_n], root_n, root_d),
+    }
+    ica = {
+        "subject": "Intermediate CA1",
+        "issuer": "Root CA",
+        "public_key": [ica_e, ica_n],
+        "public_key_c": [root_e, root_n],
+        "timestamp": TIMESTAMP,
+        "signature": sign("Intermediate CA1", [ica_e, ica_n], root_n, root_d),
+    }
+    client = {
+        "public_key": [e, n],
+        "private_key": d,
+        "certificate": {
+            "subject": "Client1",
+            "issuer": "Intermediate CA1",
+            "public_key": [ica_e, ica_n],
+            "public_key_c": [e, n],
+            "timestamp": TIMESTAMP,
+            "signature": sign("Client1", [e, n], ica_n, ica_d),
+        },
+    }
+    return {"root": root, "ica": ica, "client": client, "keys": (n, e, d)}
+
+
+def verify(data_str: str, signature: dict, public_key) -> bool:
+    e, n = public_key
+    return custom_hash(data_str, n) == pow(signature["s"], e, n)
+
+
+def validate_chain(chain: dict) -> None:
+    """Те же шаги, что в generate_keys_usecase, без сети и файлов."""
+    client_cert = ClientCertificate(chain["client"], "Client1")
+    client_cert.validate()
+    ica_cert = IntermediateCertificate(chain["ica"])
+    ica_cert.validate()
+    root_cert = RootCertificate(chain["root"])
+    root_cert.validate()
+    if not verify(
+        client_cert.client_data_str(), client_cert.signature, ica_cert.public_key
+    ):
+        raise ValueError("Подпись сертификата клиента не верна")
+    if not verify(ica_cert.to_data_str(), ica_cert.signature, root_cert.public_key):
+        raise ValueError("Подпись сертификата ICA не верна")
+    if not verify(root_cert.to_data_str(), root_cert.signature, root_cert.public_key):
+        raise ValueError("Подпись сертификата Root не верна")
+
+
+def message_body(chain: dict) -> str:
+    n, e, d = chain["keys"]
+    message = "benchmark message"
+    signature = sign(message, [e, n], n, d)
+    return json.dumps(
+        {
+            "subject": "Client1",
+            "message": message,
+            "signature": signature,
+            "timestamp": TIMESTAMP,
+            "public_keys": [e, n],
+            "certificate": chain["client"]["certificate"],
+            "root_ca": chain["root"],
+            "ca_ca": chain["ica"],
+        }
+    )
+
+
+def cases(bits_list: List[int]) -> Dict[str, Callable[[], object]]:
+    result: Dict[str, Callable[[], object]] = {}
+    for bits in bits_list:
+        chain = make_chain(bits)
+        n, e, d = chain["keys"]
+        data_str = construct_data_str("Client1", [e, n], TIMESTAMP)
+        r = custom_hash(data_str, n)
+        signature = Signature(r=r, s=pow(r, d, n))
+        body = message_body(chain)
+        validate_chain(chain)
+        if not check_signature(signature, data_str, e, n):
+            raise SystemExit(f"Подпись не прошла проверку при {bits} бит")
+
+        result[f"generate_prime/{bits}"] = lambda bits=bits: generate_prime(bits)
+        result[f"generate_keys/{bits}"] = lambda bits=bits: generate_keys(bits)
+        result[f"sign/{bits}"] = lambda r=r, d=d, n=n: pow(r, d, n)
+        result[f"check_signature/{bits}"] = (
+            lambda signature=signature, data_str=data_str, e=e, n=n: check_signature(
+                signature, data_str, e, n
+            )
+        )
+        result[f"chain_validation/{bits}"] = lambda chain=chain: validate_chain(chain)
+        result[f"parse_message/{bits}"] = (
+            lambda body=body: IncomingMessage.model_validate_json(body)
+        )
+
+    # Хэш от размера ключа почти не зависит: n берётся от наибольшего,
+    # но его размер входит в имя, чтобы не сравнивать разные условия
+    bits = max(bits_list)
+    _, _, n, _, _ = generate_keys(bits)
+    for size in HASH_SIZES:
+        message = "x" * size
+        result[f"custom_hash/{bits}/{size}"] = (
+            lambda message=message: custom_hash(message, n)
+        )
+    return result
+
+
+# Условия замера, при расхождении которых сравнение с базой неточно
+COMPARABLE_META = ("python", "machine", "seconds", "repeats", "min_rounds")
+
+
+def meta_mismatches(meta: dict, baseline_meta: dict) -> List[str]:
+    return [
+        f"{key}: база {baseline_meta.get(key)!r}, сейчас {meta.get(key)!r}"
+        for key in COMPARABLE_META
+        if baseline_meta.get(key) != meta.get(key)
+    ]
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    regressions = []
+    print(f"{'метрика':<28} {'база мс':>11} {'сейчас мс':>11} {'изм.':>8}")
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<28} {'-':>11} {current['per_op_s'] * 1000:>11.4f}")
+            continue
+        ratio = current["per_op_s"] / base["per_op_s"]
+        mark = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            mark = " РЕГРЕССИЯ"
+        print(
+            f"{name:<28} {base['per_op_s'] * 1000:>11.4f} "
+            f"{current['per_op_s'] * 1000:>11.4f} {ratio - 1:>+7.0%}{mark}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bits", type=int, nargs="+", default=DEFAULT_BITS)
+    parser.add_argument("--seconds", type=float, default=0.2)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--min-rounds", type=int, default=20)
+    parser.add_argument("--filter", default="", help="подстрока в имени метрики")
+    parser.add_argument("--output", help="куда записать JSON с результатами")
+    parser.add_argument("--compare", help="JSON с базовыми результатами")
+    parser.add_argument("--threshold", type=float, default=0.3)
+    parser.add_argument(
+        "--allow-meta-mismatch",
+        action="store_true",
+        help="сравнивать, даже если python, машина или параметры замера другие",
+    )
+    args = parser.parse_args()
+
+    results = {}
+    for name, fn in cases(args.bits).items():
+        if args.filter in name:
+            if name.startswith(RANDOMIZED):
+                results[name] = measure_mean(fn, args.seconds, args.min_rounds)
+            else:
+                results[name] = measure(fn, args.seconds, args.repeats)
+            if not args.compare:
+                print(f"{name:<28} {results[name]['per_op_s'] * 1000:>11.4f} мс")
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "bits": args.bits,
+            "seconds": args.seconds,
+            "repeats": args.repeats,
+            "min_rounds": args.min_rounds,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        mismatches = meta_mismatches(report["meta"], baseline.get("meta", {}))
+        for mismatch in mismatches:
+            print(f"Условия замера отличаются от базы — {mismatch}", file=sys.stderr)
+        if mismatches and not args.allow_meta_mismatch:
+            raise SystemExit(
+                "База снята в других условиях; переснимите её на этой машине "
+                "или запустите с --allow-meta-mismatch"
+            )
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            raise SystemExit(f"Регрессия больше {args.threshold:.0%}: {regressions}")
+
+
+if __name__ == "__main__":
+    main()
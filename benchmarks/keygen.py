@@ -0,0 +1,45 @@
+"""Бенчмарк генерации ключей RSA: ключей в секунду для разных длин простых.
+
+Запуск из корня репозитория:
+    python benchmarks/keygen.py
+    python benchmarks/keygen.py --bits 64 512 --seconds 5
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "root_ca"))
+
+from crypto_utils import generate_keys  # noqa: E402
+
+DEFAULT_BITS = [64, 512, 1024, 2048]
+
+
+def bench(bits: int, seconds: float, min_keys: int) -> tuple[int, float]:
+    count = 0
+    start = time.perf_counter()
+    while True:
+        generate_keys(bits)
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds and count >= min_keys:
+            return count, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bits", type=int, nargs="+", default=DEFAULT_BITS)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--min-keys", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'bits':>6} {'keys':>8} {'sec':>8} {'keys/s':>10}")
+    for bits in args.bits:
+        count, elapsed = bench(bits, args.seconds, args.min_keys)
+        print(f"{bits:>6} {count:>8} {elapsed:>8.2f} {count / elapsed:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""Нагрузочный стенд: вся топология PKI локальными процессами на localhost.
+
+Поднимает root_ca, api (реестр сервисов), ca1, ca2 и N клиентов из копий
+каталогов сервисов во временной директории, вместо имён docker-compose
+сервисы находят друг друга через реестр. Затем выстраивает иерархию
+(ключи и сертификаты Root → ICA → клиенты) и гоняет нагрузку:
+
+    issuance  — выпуск клиентских сертификатов, поровну на ca1 и ca2;
+    messages  — отправка подписанных сообщений между случайными клиентами
+                (клиенты поровну привязаны к ca1 и ca2, трафик смешанный);
+    mixed     — обе нагрузки вперемешку.
+
+Для каждого эндпоинта печатает пропускную способность, p50/p95/p99
+и число ошибок.
+
+Запуск из корня репозитория:
+    python benchmarks/load_harness.py
+    python benchmarks/load_harness.py --clients 8 --requests 2000 --concurrency 32
+    python benchmarks/load_harness.py --workload messages --output load.json
+    python benchmarks/load_harness.py --workload issuance --workers 4
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+HOST = "127.0.0.1"
+CAS = ("ca1", "ca2")
+# Состояние, которое сервисы создают в рабочем каталоге, не копируется
+STATE = shutil.ignore_patterns(
+    "__pycache__", "data", "cert_store", "signed_ica_certs", "certs", "*.db"
+)
+WORKLOADS = ("issuance", "messages", "mixed")
+# Ответ получателя при успешной проверке подписи и цепочки (get_message.py)
+VERIFIED_CHECK = "Подпись верна"
+
+Sample = Tuple[str, float, bool]
+
+
+class Topology:
+    """Процессы сервисов и их адреса на localhost."""
+
+    def __init__(self, workdir: str, base_port: int, clients: int, workers: int = 1):
+        self.workdir = workdir
+        # Число процессов uvicorn у root_ca, ca1 и ca2
+        self.workers = workers
+        self.session = requests.Session()
+        self.processes: Dict[str, subprocess.Popen] = {}
+        self.urls: Dict[str, str] = {}
+        self.ports = {"root_ca": base_port, "api": base_port + 1}
+        for i, ca in enumerate(CAS):
+            self.ports[ca] = base_port + 2 + i
+        self.clients = [f"client{i}" for i in range(1, clients + 1)]
+        for i, client in enumerate(self.clients):
+            self.ports[client] = base_port + 10 + i
+
+    def copy(self, service: str, name: Optional[str] = None) -> str:
+        path = os.path.join(self.workdir, name or service)
+        shutil.copytree(os.path.join(ROOT, service), path, ignore=STATE)
+        return path
+
+    def spawn(self, name: str, cwd: str, args: List[str], env: dict) -> None:
+        log = open(os.path.join(self.workdir, f"{name}.log"), "w")
+        self.processes[name] = subprocess.Popen(
+            [sys.executable, *args],
+            cwd=cwd,
+            env={**os.environ, "PYTHONUNBUFFERED": "1", **env},
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        self.urls[name] = f"http://{HOST}:{self.ports[name]}"
+
+    def uvicorn(self, name: str, cwd: str, env: dict) -> None:
+        args = ["-m", "uvicorn", "main:app", "--host", HOST]
+        args += ["--workers", str(self.workers)]
+        self.spawn(name, cwd, args + ["--port", str(self.ports[name])], env)
+
+    def wait(self, name: str, path: str, timeout: float = 30.0) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.processes[name].poll() is not None:
+                raise SystemExit(f"{name} завершился, см. {self.workdir}/{name}.log")
+            try:
+                if self.session.get(self.urls[name] + path, timeout=1).ok:
+                    return
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(0.1)
+        raise SystemExit(f"{name} не поднялся за {timeout:.0f} с")
+
+    def call(self, method: str, name: str, path: str, **kwargs) -> dict:
+        rs = self.session.request(method, self.urls[name] + path, timeout=60, **kwargs)
+        rs.raise_for_status()
+        return rs.json()
+
+    def start(self) -> None:
+        root = self.copy("root_ca")
+        self.uvicorn(
+            "root_ca",
+            root,
+            {
+                "LOG_PATH": os.path.join(root, "data", "logs"),
+                "CERT_STORE": os.path.join(root, "cert_store"),
+            },
+        )
+
+        api = self.copy("api")
+        with open(os.path.join(api, "config.toml"), "w") as f:
+            f.write(f'[API]\nhost="{HOST}"\nport={self.ports["api"]}\n')
+        self.spawn("api", api, ["main.py"], {})
+        registry = self.urls["api"]
+
+        for ca in CAS:
+            path = self.copy(ca)
+            os.makedirs(os.path.join(path, "signed_ica_certs"))
+            self.uvicorn(
+                ca,
+                path,
+                {
+                    "ROOT_CA_URL": self.urls["root_ca"],
+                    "REGISTRY_URL": registry,
+                    "CA_NAME": ca,
+                    "CA_HOST": HOST,
+                    "CA_PORT": str(self.ports[ca]),
+                },
+            )
+
+        for i, client in enumerate(self.clients):
+            self.spawn(
+                client,
+                self.copy("client", client),
+                ["main.py"],
+                {
+                    "CLIENT_NAME": client.capitalize(),
+                    "MY_CA": CAS[i % len(CAS)],
+                    "REGISTRY_URL": registry,
+                    "CLIENT_HOST": HOST,
+                    "CLIENT_PORT": str(self.ports[client]),
+                    "HEARTBEAT_INTERVAL": "1",
+                },
+            )
+
+        self.wait("root_ca", "/get_logs")
+        self.wait("api", "/register/data_centers")
+        for ca in CAS:
+            self.wait(ca, "/key_pool")
+        for client in self.clients:
+            self.wait(client, "/http_pool")
+
+    def bootstrap(self) -> None:
+        """Ключи и сертификаты по всей цепочке, как при ручной настройке."""
+        self.call("POST", "root_ca", "/generate_keys")
+        self.call("POST", "root_ca", "/issue_root_cert")
+        for ca in CAS:
+            self.call("POST", ca, "/generate_keys")
+            self.call("GET", ca, "/get_root_cert")
+            self.call("POST", ca, "/request_ica_cert")
+        # Клиенты ищут УЦ и друг друга через реестр
+        self.wait_registered()
+        for client in self.clients:
+            for method, path in (
+                ("GET", "/certs/all_certs"),
+                ("POST", "/certs/generate_keys_and_cert"),
+            ):
+                result = self.call(method, client, path)
+                if result.get("status") != "success":
+                    raise SystemExit(f"{client} {path}: {result.get('message')}")
+
+    def wait_registered(self, timeout: float = 30.0) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            data_centers = self.call("GET", "api", "/register/data_centers")
+            clients = self.call("GET", "api", "/register/clients")
+            if len(data_centers) == len(CAS) and len(clients) == len(self.clients):
+                return
+            time.sleep(0.2)
+        raise SystemExit("Не все сервисы зарегистрировались в реестре")
+
+    def stop(self) -> None:
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def issuance_job(topology: Topology, i: int):
+    ca = CAS[i % len(CAS)]
+    return f"{ca} GET /cert", "GET", topology.urls[ca] + "/cert", {
+        "params": {"subject": f"Load{i}"}
+    }
+
+
+def message_job(topology: Topology, i: int):
+    sender, recipient = random.sample(topology.clients, 2)
+    return "client POST /message/send_message", "POST", (
+        topology.urls[sender] + "/message/send_message"
+    ), {"params": {"client_id": recipient[len("client"):], "msg": f"load {i}"}}
+
+
+def execute(session: requests.Session, job) -> Sample:
+    label, method, url, kwargs = job
+    start = time.perf_counter()
+    try:
+        rs = session.request(method, url, timeout=60, **kwargs)
+        ok = rs.status_code == 200
+        if ok and label.startswith("client"):
+            # Доставка прошла, но подпись у получателя не сошлась — тоже ошибка
+            ok = rs.json().get("check") == VERIFIED_CHECK
+    except requests.exceptions.RequestException:
+        ok = False
+    return label, time.perf_counter() - start, ok
+
+
+def run(topology: Topology, workload: str, count: int, concurrency: int) -> dict:
+    jobs = []
+    for i in range(count):
+        if workload == "issuance":
+            jobs.append(issuance_job(topology, i))
+        elif workload == "messages":
+            jobs.append(message_job(topology, i))
+        elif i % 2 == 0:
+            jobs.append(issuance_job(topology, i // 2))
+        else:
+            jobs.append(message_job(topology, i // 2))
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=64, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(lambda job: execute(session, job), jobs))
+    return report(samples, time.perf_counter() - start)
+
+
+def percentile(values: List[float], q: float) -> float:
+    index = max(0, min(len(values) - 1, round(q * len(values)) - 1))
+    return values[index]
+
+
+def report(samples: List[Sample], elapsed: float) -> dict:
+    by_label: Dict[str, List[Tuple[float, bool]]] = defaultdict(list)
+    for label, latency, ok in samples:
+        by_label[label].append((latency, ok))
+    result = {}
+    for label, values in sorted(by_label.items()):
+        latencies = sorted(latency for latency, _ in values)
+        result[label] = {
+            "requests": len(values),
+            "errors": sum(1 for _, ok in values if not ok),
+            "rps": len(values) / elapsed,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+        }
+    return {"elapsed_s": elapsed, "endpoints": result}
+
+
+def print_report(workload: str, result: dict) -> None:
+    print(f"\n{workload}: {result['elapsed_s']:.2f} с")
+    print(
+        f"{'эндпоинт':<36} {'запросов':>8} {'ошибок':>7} {'rps':>8} "
+        f"{'p50 мс':>8} {'p95 мс':>8} {'p99 мс':>8}"
+    )
+    for label, stats in result["endpoints"].items():
+        print(
+            f"{label:<36} {stats['requests']:>8} {stats['errors']:>7} "
+            f"{stats['rps']:>8.1f} {stats['p50_ms']:>8.1f} "
+            f"{stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument(
+        "--workload", choices=WORKLOADS, nargs="+", default=list(WORKLOADS)
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="процессов uvicorn у root_ca и УЦ"
+    )
+    parser.add_argument("--base-port", type=int, default=18000)
+    parser.add_argument("--output", help="куда записать JSON с результатами")
+    parser.add_argument(
+        "--keep", action="store_true", help="не удалять рабочий каталог и логи"
+    )
+    args = parser.parse_args()
+    if args.clients < 2:
+        parser.error("для обмена сообщениями нужно хотя бы 2 клиента")
+
+    workdir = tempfile.mkdtemp(prefix="pki-load-")
+    topology = Topology(workdir, args.base_port, args.clients, args.workers)
+    results = {}
+    try:
+        topology.start()
+        topology.bootstrap()
+        for workload in args.workload:
+            results[workload] = run(
+                topology, workload, args.requests, args.concurrency
+            )
+            print_report(workload, results[workload])
+    finally:
+        topology.stop()
+        if args.keep:
+            print(f"\nЛоги и состояние сервисов: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "clients": args.clients,
+                    "workers": args.workers,
+                    "requests": args.requests,
+                    "concurrency": args.concurrency,
+                    "workloads": results,
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
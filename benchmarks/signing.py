@@ -0,0 +1,52 @@
+"""Микробенчмарк подписи RSA: pow(r, d, n) против CRT-подписи.
+
+Запуск из корня репозитория:
+    python benchmarks/signing.py
+    python benchmarks/signing.py --modulus-bits 1024 --rounds 500
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "root_ca"))
+
+from crypto_utils import CRTSigner, custom_hash, generate_keys  # noqa: E402
+
+DEFAULT_MODULUS_BITS = [1024, 2048, 4096]
+
+
+def per_op(fn, values) -> float:
+    start = time.perf_counter()
+    for r in values:
+        fn(r)
+    return (time.perf_counter() - start) / len(values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--modulus-bits", type=int, nargs="+", default=DEFAULT_MODULUS_BITS
+    )
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'n bits':>7} {'pow ms':>9} {'crt ms':>9} {'speedup':>8}")
+    for modulus_bits in args.modulus_bits:
+        p, q, n, e, d = generate_keys(modulus_bits // 2)
+        signer = CRTSigner(p, q, d)
+        values = [custom_hash(f"message {i}", n) for i in range(args.rounds)]
+        for r in values:
+            if signer.sign(r) != pow(r, d, n):
+                raise SystemExit(f"CRT-подпись не совпала при {modulus_bits} бит")
+        plain = per_op(lambda r: pow(r, d, n), values)
+        crt = per_op(signer.sign, values)
+        print(
+            f"{n.bit_length():>7} {plain * 1000:>9.3f} {crt * 1000:>9.3f} "
+            f"{plain / crt:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
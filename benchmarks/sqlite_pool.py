@@ -0,0 +1,117 @@
+"""Бенчмарк SQLite для сервиса api: одно общее соединение против пула
+соединений в WAL-режиме и групповых коммитов при конкурентных запросах.
+
+Запуск из корня репозитория:
+    python benchmarks/sqlite_pool.py
+    python benchmarks/sqlite_pool.py --threads 16 --ops 2000
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "api"))
+
+from db import ConnectionPool, WriteBatcher  # noqa: E402
+
+SCHEMA = "CREATE TABLE IF NOT EXISTS bench(id INTEGER PRIMARY KEY, body TEXT)"
+INSERT = "INSERT INTO bench(body) VALUES (?)"
+SELECT = "SELECT body FROM bench WHERE id = ?"
+
+
+def run(threads: int, ops: int, worker) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(worker, range(threads)))
+    return threads * ops / (time.perf_counter() - start)
+
+
+def bench_shared(path: str, threads: int, ops: int) -> tuple[float, float]:
+    # Как было: одно соединение на процесс, доступ сериализован
+    db = sqlite3.connect(path, check_same_thread=False)
+    db.execute(SCHEMA)
+    lock = threading.Lock()
+
+    def insert(_):
+        for i in range(ops):
+            with lock:
+                db.execute(INSERT, (f"message {i}",))
+                db.commit()
+
+    def select(_):
+        for i in range(ops):
+            with lock:
+                db.execute(SELECT, (i + 1,)).fetchone()
+
+    result = run(threads, ops, insert), run(threads, ops, select)
+    db.close()
+    return result
+
+
+def bench_pool(path: str, threads: int, ops: int) -> tuple[float, float]:
+    pool = ConnectionPool(path, size=threads)
+    with pool.connection() as db:
+        db.execute(SCHEMA)
+
+    def insert(_):
+        for i in range(ops):
+            with pool.connection() as db:
+                db.execute(INSERT, (f"message {i}",))
+
+    def select(_):
+        for i in range(ops):
+            with pool.connection() as db:
+                db.execute(SELECT, (i + 1,)).fetchone()
+
+    result = run(threads, ops, insert), run(threads, ops, select)
+    pool.close()
+    return result
+
+
+def bench_batched(path: str, threads: int, ops: int) -> tuple[float, float]:
+    pool = ConnectionPool(path, size=threads)
+    with pool.connection() as db:
+        db.execute(SCHEMA)
+    writer = WriteBatcher(path)
+
+    def insert(_):
+        for i in range(ops):
+            writer.execute(INSERT, (f"message {i}",))
+
+    def select(_):
+        for i in range(ops):
+            with pool.connection() as db:
+                db.execute(SELECT, (i + 1,)).fetchone()
+
+    result = run(threads, ops, insert), run(threads, ops, select)
+    writer.close()
+    pool.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=500, help="операций на поток")
+    args = parser.parse_args()
+
+    print(f"{'mode':>10} {'insert/s':>10} {'select/s':>10}")
+    for name, bench in (
+        ("shared", bench_shared),
+        ("pool", bench_pool),
+        ("batched", bench_batched),
+    ):
+        with tempfile.TemporaryDirectory() as tmp:
+            inserts, selects = bench(
+                os.path.join(tmp, "bench.db"), args.threads, args.ops
+            )
+        print(f"{name:>10} {inserts:>10.0f} {selects:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
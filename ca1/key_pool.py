@@ -0,0 +1,159 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Deque, Optional, Tuple
+
+from metrics import KEYGEN_SECONDS, observe_pool
+from utils import generate_keys
+
+KeyPair = Tuple[int, int, int, int, int]
+
+# Настройки пула берутся из переменных окружения
+KEY_POOL_SIZE = int(os.getenv("KEY_POOL_SIZE", "16"))
+KEY_POOL_LOW_WATER = int(os.getenv("KEY_POOL_LOW_WATER", "4"))
+KEY_POOL_WORKERS = int(os.getenv("KEY_POOL_WORKERS", "2"))
+
+
+def generate_timed(bits: int) -> Tuple[KeyPair, float]:
+    # Метрики дочернего процесса не видны, поэтому время возвращается вместе
+    # с ключами и записывается в гистограмму основного процесса
+    start = time.perf_counter()
+    keypair = generate_keys(bits)
+    return keypair, time.perf_counter() - start
+
+
+class KeyPool:
+    """Ограниченный пул заранее сгенерированных ключей RSA.
+
+    Когда число готовых ключей опускается до low_water, пул дозаполняется
+    до size в фоновых процессах. Если пул пуст, ключ генерируется сразу.
+    Если процесс пула погиб, пул процессов пересоздаётся.
+    """
+
+    def __init__(
+        self,
+        size: int = KEY_POOL_SIZE,
+        low_water: int = KEY_POOL_LOW_WATER,
+        workers: int = KEY_POOL_WORKERS,
+        bits: int = 64,
+    ):
+        if size < 1:
+            raise ValueError("size должен быть положительным")
+        if not 0 <= low_water < size:
+            raise ValueError("low_water должен быть в диапазоне [0, size)")
+        self.size = size
+        self.low_water = low_water
+        self.workers = workers
+        self.bits = bits
+        self._keys: Deque[KeyPair] = deque()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.hits = 0
+        self.misses = 0
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # Не fork: процессы создаются, когда в УЦ уже работают потоки, и
+        # ребёнок мог бы унаследовать занятую ими блокировку
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+
+    def start(self) -> None:
+        if self.workers > 0:
+            self._executor = self._new_executor()
+            observe_pool(
+                "key_pool_workers", lambda: min(self._pending, self.workers), self.workers
+            )
+        self._refill()
+
+    def shutdown(self) -> None:
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def depth(self) -> int:
+        return len(self._keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "depth": len(self._keys),
+                "pending": self._pending,
+                "size": self.size,
+                "low_water": self.low_water,
+                "workers": self.workers,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def get(self) -> KeyPair:
+        with self._lock:
+            keypair = self._keys.popleft() if self._keys else None
+            if keypair is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        self._refill()
+        if keypair is None:
+            logging.info("Пул ключей пуст, генерируем ключи в запросе")
+            keypair = generate_keys(self.bits)
+        return keypair
+
+    def _refill(self) -> None:
+        executor = self._executor
+        if executor is None:
+            return
+        with self._lock:
+            if len(self._keys) + self._pending > self.low_water:
+                return
+            missing = self.size - len(self._keys) - self._pending
+            self._pending += missing
+        for submitted in range(missing):
+            try:
+                future = executor.submit(generate_timed, self.bits)
+            except BrokenProcessPool as e:
+                with self._lock:
+                    self._pending -= missing - submitted
+                self._rebuild(executor, e)
+                self._refill()
+                return
+            except RuntimeError:
+                # Пул процессов уже остановлен
+                with self._lock:
+                    self._pending -= 1
+                continue
+            future.add_done_callback(
+                lambda future, executor=executor: self._on_generated(executor, future)
+            )
+
+    def _rebuild(self, broken: ProcessPoolExecutor, error: BaseException) -> None:
+        with self._lock:
+            # Пул уже пересоздан другим потоком или остановлен
+            if self._executor is not broken:
+                return
+            logging.error(f"Пул процессов генерации ключей сломан, пересоздаём: {error}")
+            self._executor = self._new_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _on_generated(self, executor: ProcessPoolExecutor, future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is None and len(self._keys) < self.size:
+                self._keys.append(future.result()[0])
+        if error is None:
+            KEYGEN_SECONDS.labels(self.bits).observe(future.result()[1])
+        elif isinstance(error, BrokenProcessPool):
+            self._rebuild(executor, error)
+            self._refill()
+        else:
+            logging.error(f"Ошибка фоновой генерации ключей: {error}")
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import re
+import time
+from typing import AsyncIterator, List, Optional, Tuple
+
+from anyio import to_thread
+
+# Длина метки времени "YYYY-MM-DD HH:MM:SS" в начале строки лога
+TIMESTAMP_LEN = 19
+TAIL_POLL_INTERVAL = 0.5
+# Начало записи лога; строки без метки — продолжение (например, traceback)
+RECORD_START = re.compile(rb"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d")
+
+
+def strip_prefix(line: str) -> Optional[str]:
+    # Убираем всё до ']' (включительно)
+    if "] " not in line:
+        return None
+    return line.split("] ", 1)[1].rstrip()
+
+
+def since_str(since: float) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(since))
+
+
+def _line_time(line: bytes) -> bytes:
+    return line[:TIMESTAMP_LEN]
+
+
+def _is_record(line: bytes) -> bool:
+    return RECORD_START.match(line) is not None
+
+
+def _record_from(f, pos: int) -> Tuple[int, bytes]:
+    # Первая строка с меткой времени, начинающаяся не раньше pos;
+    # строки-продолжения многострочных записей пропускаются
+    if pos:
+        f.seek(pos - 1)
+        f.readline()
+    else:
+        f.seek(0)
+    while True:
+        start = f.tell()
+        line = f.readline()
+        if not line or _is_record(line):
+            return start, line
+
+
+def offset_since(path: str, since: float) -> int:
+    """Смещение первой записи не старше since (бинарный поиск по файлу)."""
+    target = since_str(since).encode()
+    with open(path, "rb") as f:
+        lo, hi = 0, os.fstat(f.fileno()).st_size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start, line = _record_from(f, mid)
+            if line and _line_time(line) < target:
+                lo = start + len(line)
+            else:
+                hi = mid
+        # lo может указывать на продолжение предыдущей записи
+        return _record_from(f, lo)[0]
+
+
+def read_page(
+    path: str, offset: int, limit: int, since: Optional[float] = None
+) -> Tuple[List[str], int]:
+    """До limit строк начиная с байта offset и смещение следующей страницы.
+
+    Незавершённая последняя строка не отдаётся, её вернёт следующий запрос.
+    Если offset больше размера файла (лог очищен при перезапуске),
+    чтение начинается сначала.
+    """
+    size = os.path.getsize(path)
+    if offset > size:
+        offset = 0
+    if since is not None and offset == 0:
+        offset = offset_since(path, since)
+    target = since_str(since).encode() if since is not None else None
+
+    lines: List[str] = []
+    skipping = False
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while len(lines) < limit:
+            raw = f.readline()
+            if not raw.endswith(b"\n"):
+                break
+            offset = f.tell()
+            # Продолжение записи наследует решение по её первой строке
+            if target is not None and _is_record(raw):
+                skipping = _line_time(raw) < target
+            if skipping:
+                continue
+            text = strip_prefix(raw.decode("utf-8", errors="replace"))
+            if text is not None:
+                lines.append(text)
+    return lines, offset
+
+
+def resume_offset(last_event_id: Optional[str], default: int) -> int:
+    """Смещение из заголовка Last-Event-ID; некорректное или отрицательное — default."""
+    try:
+        offset = int(last_event_id)
+    except (TypeError, ValueError):
+        return default
+    return offset if offset >= 0 else default
+
+
+async def tail(
+    path: str, offset: int, is_disconnected, limit: int = 1000
+) -> AsyncIterator[str]:
+    """Server-Sent Events с новыми строками лога, начиная с offset.
+
+    Одно событие — пачка строк (по строке в поле data), id — смещение
+    после пачки, его можно передать обратно в Last-Event-ID.
+    """
+    while not await is_disconnected():
+        # Чтение файла — в пуле потоков, чтобы не блокировать цикл событий
+        lines, offset = await to_thread.run_sync(read_page, path, offset, limit)
+        if lines:
+            data = "".join(f"data: {text}\n" for text in lines)
+            yield f"id: {offset}\n{data}\n"
+        else:
+            await asyncio.sleep(TAIL_POLL_INTERVAL)
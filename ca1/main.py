@@ -1,6 +1,6 @@
-from fastapi import FastAPI, HTTPException, Request
-from pydantic import BaseModel
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from pydantic import BaseModel, Field
+from fastapi.responses import JSONResponse, HTMLResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import time
@@ -8,27 +8,66 @@ import os
 import json
 import logging
 import time
+import hashlib
+import threading
 import requests
-from utils import generate_keys, custom_hash, construct_data_str
-
-FIRST_SERVER_URL = "http://root_ca:8000"
+from collections import OrderedDict
+from typing import Optional
+from utils import (
+    check_cert_signature,
+    check_key_pair,
+    construct_data_str,
+    construct_status_str,
+    custom_hash,
+    generate_keys,
+    get_signer,
+)
+from key_pool import KeyPool
+from keystore import KeyStore, KeyStoreConflict, KeyStoreLocked, passphrase_from_env
+from ledger import CertLedger
+from revocation import FINGERPRINT_PATTERN, RevocationList
+from log_reader import read_page, resume_offset, tail
+from http_client import pool_stats, upstream
+import metrics
+import tracing
+
+FIRST_SERVER_URL = os.getenv("ROOT_CA_URL", "http://root_ca:8000")
+# Реестр сервисов (api); если задан, УЦ регистрируется в нём при старте
+REGISTRY_URL = os.getenv("REGISTRY_URL")
+CA_NAME = os.getenv("CA_NAME", "ca1")
+CA_HOST = os.getenv("CA_HOST", CA_NAME)
+CA_PORT = int(os.getenv("CA_PORT", "8001"))
 CERT_PATH = "signed_ica_certs"
 local_root_cert = None
 
 app = FastAPI()
+metrics.instrument(app)
+tracing.instrument(app, CA_NAME)
 
 # Монтируем статические файлы и шаблоны
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
+# Каталоги
+CERT_STORE = os.path.join(os.getcwd(), "cert_store")
+SIGNED_ICA_DIR = os.path.join(CERT_STORE, "signed_ica_certs")
+os.makedirs(SIGNED_ICA_DIR, exist_ok=True)
+
+# Ключи УЦ и полученные сертификаты — в общем для всех воркеров хранилище:
+# {"version", "keys": {"p", "q", "n", "e", "d"}, "root_cert", "ica_cert"}.
+# С KEYSTORE_PASSPHRASE закрытые ключи в нём зашифрованы
+keystore = KeyStore(os.path.join(CERT_STORE, "keystore.json"), passphrase_from_env())
+
 # Настройка логирования
 LOG_PATH = os.path.join(os.getcwd(), "data", "logs")
 os.makedirs(LOG_PATH, exist_ok=True)
 log_file = os.path.join(LOG_PATH, "service.log")
 
-# Очистка лога перед запуском
-with open(log_file, "w"):
-    pass
+# Очистка лога только при холодном старте: после перезапуска с
+# сохранёнными ключами история выпуска остаётся
+if not os.path.exists(keystore.path):
+    with open(log_file, "w"):
+        pass
 
 # Настройка логгера
 logging.basicConfig(
@@ -38,14 +77,118 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S,%f",
 )
 
-# В памяти
-keys: dict[str, int] = {}
-root_cert: dict = {}
+# Журнал выданных клиентских сертификатов
+ledger = CertLedger(os.path.join(CERT_STORE, "issued_certs.ledger"))
+# Список отозванных сертификатов
+revocations = RevocationList(os.path.join(CERT_STORE, "revocations.jsonl"))
+# Наибольшее число записей в одном ответе /crl
+CRL_DELTA_LIMIT = int(os.getenv("CRL_DELTA_LIMIT", "10000"))
+# Срок действия подписанного ответа о статусе сертификата, секунды
+STATUS_VALIDITY = int(os.getenv("STATUS_VALIDITY", "300"))
+STATUS_CACHE_SIZE = int(os.getenv("STATUS_CACHE_SIZE", "10000"))
+
+
+def warm_start() -> bool:
+    """Поднимает ключи и сертификаты из хранилища, проверив их один раз.
+
+    Несогласованные ключи убираются в сторону, и УЦ стартует пустым, как
+    раньше. Сертификат, не подходящий к ключам или к Root-сертификату,
+    сбрасывается: его остаётся запросить заново, ключи при этом целы.
+    Ключи, зашифрованные другим паролем или без пароля, — ошибка запуска.
+    """
+    started = time.perf_counter()
+    try:
+        state = keystore.load()
+    except KeyStoreLocked as e:
+        logging.critical(f"Хранилище ключей не открыто: {e}")
+        raise
+    keys = state.get("keys")
+    if not keys:
+        logging.info("Холодный старт: ключей в хранилище нет")
+        return False
+    if not check_key_pair(keys):
+        target = keystore.discard("ключи не согласованы")
+        logging.error(f"Ключи в хранилище не согласованы, файл перемещён в {target}")
+        return False
+    root_cert, ica_cert = state.get("root_cert"), state.get("ica_cert")
+    changes = {}
+    if root_cert and not check_cert_signature(root_cert, root_cert["public_key"]):
+        logging.error("Подпись Root-сертификата в хранилище не верна, он сброшен")
+        changes["root_cert"] = root_cert = None
+    if ica_cert and not (
+        ica_cert["public_key"] == [keys["e"], keys["n"]]
+        and root_cert
+        and check_cert_signature(ica_cert, root_cert["public_key"])
+    ):
+        logging.error("Сертификат ICA в хранилище не подходит к ключам, он сброшен")
+        changes["ica_cert"] = ica_cert = None
+    # Файлы цепочки в signed_ica_certs — копия хранилища (/all_certs и /cert
+    # читают само хранилище): сброшенный сертификат удаляется, отсутствующий
+    # или устаревший — перезаписывается
+    os.makedirs(CERT_PATH, exist_ok=True)
+    files_changed = False
+    for filename, field, cert in (
+        ("root.json", "root_cert", root_cert),
+        ("ica.json", "ica_cert", ica_cert),
+    ):
+        path = os.path.join(CERT_PATH, filename)
+        try:
+            with open(path, "r") as f:
+                on_disk = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            on_disk = None
+        if field in changes and os.path.exists(path):
+            os.remove(path)
+            files_changed = True
+        elif cert and on_disk != cert:
+            with open(path, "w") as f:
+                json.dump(cert, f, indent=2)
+            files_changed = True
+    if changes or files_changed or (keystore.encrypted and keystore.plaintext_secrets):
+        # Заодно перезаписывает ключи зашифрованными, если пароль задан впервые
+        keystore.update(changes)
+    elapsed = (time.perf_counter() - started) * 1000
+    loaded = ", ".join(
+        name
+        for name, value in (("ключи", keys), ("Root", root_cert), ("ICA", ica_cert))
+        if value
+    )
+    logging.info(f"Тёплый старт: {loaded} загружены из хранилища за {elapsed:.1f} мс")
+    return True
 
-# Каталоги
-CERT_STORE = os.path.join(os.getcwd(), "cert_store")
-SIGNED_ICA_DIR = os.path.join(CERT_STORE, "signed_ica_certs")
-os.makedirs(SIGNED_ICA_DIR, exist_ok=True)
+
+warm_start()
+
+# Пул заранее сгенерированных клиентских ключей
+key_pool = KeyPool()
+
+
+def register_in_registry():
+    try:
+        rs = upstream(REGISTRY_URL).post(
+            "/register/ca", json={"name": CA_NAME, "host": CA_HOST, "port": CA_PORT}
+        )
+        rs.raise_for_status()
+        logging.info(f"УЦ {CA_NAME} зарегистрирован в реестре {REGISTRY_URL}")
+    except requests.exceptions.RequestException as e:
+        logging.warning(f"Не удалось зарегистрироваться в реестре: {e}")
+
+
+@app.on_event("startup")
+def start_key_pool():
+    key_pool.start()
+
+
+@app.on_event("startup")
+def start_registration():
+    if REGISTRY_URL:
+        # Регистрация не должна задерживать старт УЦ
+        threading.Thread(target=register_in_registry, daemon=True).start()
+
+
+@app.on_event("shutdown")
+def stop_key_pool():
+    key_pool.shutdown()
 
 
 # Модель запроса на подпись
@@ -55,15 +198,38 @@ class ICACertRequest(BaseModel):
     timestamp: int
 
 
+class RevokeRequest(BaseModel):
+    serial: Optional[int] = None
+    fingerprint: Optional[str] = Field(None, pattern=FINGERPRINT_PATTERN)
+    reason: str = ""
+
+
 @app.get("/", response_class=HTMLResponse)
 def index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 
+def write_cert_file(filename: str, cert: dict) -> None:
+    # Копия сертификата из хранилища для тех, кто читает каталог напрямую;
+    # /all_certs и /cert берут сертификаты из хранилища, вместе с ключами
+    os.makedirs(CERT_PATH, exist_ok=True)
+    with open(os.path.join(CERT_PATH, filename), "w") as f:
+        json.dump(cert, f, indent=2)
+
+
 @app.post("/generate_keys")
 def generate_keys_endpoint():
     p, q, n, e, d = generate_keys()
-    keys.update({"p": p, "q": q, "n": n, "e": e, "d": d})
+    # Сертификат ICA старого ключа сбрасывается вместе с ним, как в root_ca.
+    # Файл удаляется до записи хранилища: новая версия пересоберёт
+    # /all_certs без него во всех воркерах
+    try:
+        os.remove(os.path.join(CERT_PATH, "ica.json"))
+    except FileNotFoundError:
+        pass
+    keystore.update(
+        {"keys": {"p": p, "q": q, "n": n, "e": e, "d": d}, "ica_cert": None}
+    )
     logging.info(f"Сгенерированы ключи RSA: p={p}, q={q}, n={n}, e={e}, d={d}")
     return {"public_key": [e, n], "private_key": d}
 
@@ -72,13 +238,12 @@ def generate_keys_endpoint():
 def get_root_cert():
     global local_root_cert
     try:
-        response = requests.get(f"{FIRST_SERVER_URL}/send_root_cert")
+        response = upstream(FIRST_SERVER_URL).get("/send_root_cert")
         if response.status_code == 200:
             root_cert = response.json()
-            filename = "root.json"
-            path = os.path.join("signed_ica_certs", filename)
-            with open(path, "w") as f:
-                json.dump(root_cert, f, indent=2)
+            # Новая версия хранилища сбрасывает /all_certs во всех воркерах
+            keystore.update({"root_cert": root_cert})
+            write_cert_file("root.json", root_cert)
             logging.info(
                 f"Получен Root Certificate: subject={root_cert['subject']}, timestamp={root_cert['timestamp']}, r={root_cert['signature']['r']}, s={root_cert['signature']['s']}"
             )
@@ -99,6 +264,8 @@ def get_root_cert():
 @app.post("/request_ica_cert")
 def request_ica_cert():
     try:
+        state = keystore.load()
+        keys = state.get("keys")
         if not keys:
             raise HTTPException(
                 status_code=400, detail="Сначала вызовите /generate_keys"
@@ -114,19 +281,26 @@ def request_ica_cert():
             "timestamp": timestamp,
         }
 
-        response = requests.post("http://root_ca:8000/sign_ica_cert", json=ica_request)
+        response = upstream(FIRST_SERVER_URL).post("/sign_ica_cert", json=ica_request)
         response.raise_for_status()
 
         signed_cert = response.json()
 
-        filename = "ica.json"
-        path = os.path.join("signed_ica_certs", filename)
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        with open(path, "w") as f:
-            json.dump(signed_cert, f, indent=2)
+        # Сертификат выпущен на ключ из state: если ключи успели сменить,
+        # он уже не годится и на диск не попадает
+        keystore.update({"ica_cert": signed_cert}, expected_version=state["version"])
+        write_cert_file("ica.json", signed_cert)
 
         return signed_cert
 
+    except HTTPException:
+        raise
+
+    except KeyStoreConflict:
+        raise HTTPException(
+            status_code=409, detail="Ключи сменились во время запроса, повторите"
+        )
+
     except requests.exceptions.HTTPError as e:
         status_code = response.status_code
         logging.error(f"Ошибка {status_code} при запросе к root_ca: {e}")
@@ -141,49 +315,69 @@ def request_ica_cert():
         raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера")
 
 
-@app.get("/all_certs")
-def all_certs():
-    cert_files = [f for f in os.listdir(CERT_PATH) if f.endswith(".json")]
+# Собранная и сериализованная цепочка для /all_certs: {"body", "etag",
+# "version"}. Собирается из того же снимка хранилища, что и ключи, и
+# пересобирается, когда меняется его версия — её увеличивают
+# get_root_cert, request_ica_cert и generate_keys в любом воркере.
+bundle_cache: dict = {}
+bundle_lock = threading.Lock()
 
-    if not cert_files:
-        raise HTTPException(status_code=404, detail="В папке нет JSON-файлов")
 
-    cert_list = []
-    for filename in cert_files:
-        file_path = os.path.join(CERT_PATH, filename)
-        try:
-            with open(file_path, "r") as f:
-                cert_data = json.load(f)
-                cert_list.append(cert_data)
-        except json.JSONDecodeError:
-            raise HTTPException(
-                status_code=500, detail=f"Ошибка чтения файла {filename}"
-            )
+def build_bundle(state: dict) -> dict:
+    # Порядок прежний — как у отсортированных ica.json и root.json
+    cert_list = [state[field] for field in ("ica_cert", "root_cert") if state.get(field)]
+    if not cert_list:
+        raise HTTPException(status_code=404, detail="Сертификаты УЦ ещё не получены")
+    body = json.dumps(cert_list).encode()
+    return {"body": body, "etag": f'"{hashlib.sha256(body).hexdigest()}"'}
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+@app.get("/all_certs")
+def all_certs(request: Request):
+    state = keystore.load()
+    version = state["version"]
+    with bundle_lock:
+        if bundle_cache.get("version") != version:
+            bundle_cache.clear()
+            bundle_cache.update(build_bundle(state), version=version)
+        body, etag = bundle_cache["body"], bundle_cache["etag"]
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
     logging.info(f"Сертификаты отправлены клиенту")
-    return cert_list
+    return Response(body, media_type="application/json", headers=headers)
 
 
 @app.get("/cert")
 def client_cert(subject: str):
+    # Ключ и сертификат ICA из одного снимка: сертификат всегда от этого ключа
+    state = keystore.load()
+    keys = state.get("keys")
+    if not keys:
+        raise HTTPException(status_code=400, detail="Сначала вызовите /generate_keys")
+    if not state.get("ica_cert"):
+        raise HTTPException(
+            status_code=400, detail="Сначала вызовите /request_ica_cert"
+        )
     client_keys: dict[str, int] = {}
-    p, q, n, e, d = generate_keys()
+    p, q, n, e, d = key_pool.get()
     client_keys.update({"p": p, "q": q, "n": n, "e": e, "d": d})
     logging.info(
         f"Сгенерированы ключи RSA для клиента: p={p}, q={q}, n={n}, e={e}, d={d}"
     )
 
-    try:
-        with open(f"{CERT_PATH}/ica.json", "r") as f:
-            cert_data = json.load(f)
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=500, detail="Ошибка чтения JSON из файла")
-
     timestamp = int(time.time())
     public_key_c = [client_keys["e"], client_keys["n"]]
 
     data_str = construct_data_str(subject, public_key_c, timestamp)
     r = custom_hash(data_str, keys["n"])
-    s = pow(r, keys["d"], keys["n"])
+    s = get_signer(keys).sign(r)
     signature = {"r": r, "s": s}
     public_key = [keys["e"], keys["n"]]
 
@@ -199,6 +393,8 @@ def client_cert(subject: str):
             "signature": signature,
         },
     }
+    record = ledger.append(signed_cert["certificate"], public_key_c)
+    signed_cert["certificate"]["serial"] = record["serial"]
 
     logging.info(
         f"Сгенерированые клиентские ключи и сертификат отправлены клиенту {subject}"
@@ -206,14 +402,180 @@ def client_cert(subject: str):
     return signed_cert
 
 
+@app.get("/issued_certs")
+def issued_certs(subject: Optional[str] = None, fingerprint: Optional[str] = None):
+    # История выпусков по subject или по отпечатку открытого ключа клиента
+    if subject is not None:
+        return ledger.history(subject)
+    if fingerprint is not None:
+        return ledger.by_fingerprint(fingerprint)
+    raise HTTPException(status_code=400, detail="Укажите subject или fingerprint")
+
+
+@app.get("/issued_certs/{serial}")
+def issued_cert(serial: int):
+    record = ledger.by_serial(serial)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Сертификат не найден")
+    return record
+
+
+@app.post("/revoke")
+def revoke(request: RevokeRequest):
+    # Отзыв по serial из журнала или напрямую по отпечатку ключа клиента
+    serial, fingerprint = request.serial, request.fingerprint
+    if serial is not None:
+        record = ledger.by_serial(serial)
+        if record is None:
+            raise HTTPException(status_code=404, detail="Сертификат не найден")
+        fingerprint = record["fingerprint"]
+    elif fingerprint is None:
+        raise HTTPException(status_code=400, detail="Укажите serial или fingerprint")
+    else:
+        fingerprint = fingerprint.lower()
+        records = ledger.by_fingerprint(fingerprint)
+        serial = records[-1]["serial"] if records else None
+    entry = revocations.revoke(fingerprint, serial, request.reason)
+    invalidate_status(fingerprint)
+    logging.info(f"Отозван сертификат: serial={serial}, fingerprint={fingerprint}")
+    return entry
+
+
+@app.get("/crl")
+def crl_delta(
+    since: int = Query(0, ge=0),
+    limit: int = Query(CRL_DELTA_LIMIT, ge=1, le=CRL_DELTA_LIMIT),
+):
+    # Отзывы после версии since; клиент повторяет запрос, пока не догонит version
+    entries = revocations.delta(since, limit)
+    return {"ca": CA_NAME, "version": revocations.version, "entries": entries}
+
+
+@app.get("/crl/snapshot")
+def crl_snapshot():
+    version, body = revocations.snapshot()
+    return Response(
+        body,
+        media_type="application/octet-stream",
+        headers={"X-CRL-Version": str(version)},
+    )
+
+
+# Подписанные ответы о статусе по отпечатку ключа (LRU). Подпись — самая
+# дорогая часть ответа, поэтому ответ переиспользуется, пока не прошла
+# половина срока действия; отзыв и смена ключей УЦ сбрасывают кэш.
+status_cache: "OrderedDict[str, dict]" = OrderedDict()
+status_lock = threading.Lock()
+# Версия хранилища ключей, которой подписаны ответы в кэше
+status_keys_version = [0]
+
+
+def invalidate_status(fingerprint: Optional[str] = None):
+    with status_lock:
+        if fingerprint is None:
+            status_cache.clear()
+        else:
+            status_cache.pop(fingerprint, None)
+
+
+def sign_status(fingerprint: str, state: dict) -> dict:
+    keys = state["keys"]
+    # Клиент принимает ответ, только если ca совпадает с subject сертификата
+    # ICA, ключом которого ответ подписан
+    ca = (state.get("ica_cert") or {}).get("subject", CA_NAME)
+    revoked = revocations.get(fingerprint)
+    if revoked is not None:
+        status, serial = "revoked", revoked["serial"]
+    else:
+        records = ledger.by_fingerprint(fingerprint)
+        status = "good" if records else "unknown"
+        serial = records[-1]["serial"] if records else None
+    this_update = int(time.time())
+    next_update = this_update + STATUS_VALIDITY
+    data_str = construct_status_str(ca, fingerprint, status, this_update, next_update)
+    r = custom_hash(data_str, keys["n"])
+    return {
+        "ca": ca,
+        "fingerprint": fingerprint,
+        "status": status,
+        "serial": serial,
+        "revoked_at": revoked["revoked_at"] if revoked else None,
+        "this_update": this_update,
+        "next_update": next_update,
+        "signature": {"r": r, "s": get_signer(keys).sign(r)},
+    }
+
+
+@app.get("/status/{fingerprint}")
+def cert_status(fingerprint: str):
+    # Подписанный статус ключа клиента; подписаны ca, fingerprint, status
+    # и окно действия this_update..next_update
+    state = keystore.load()
+    if not state.get("keys"):
+        raise HTTPException(status_code=503, detail="Ключи УЦ ещё не сгенерированы")
+    fingerprint = fingerprint.lower()
+    now = int(time.time())
+    with status_lock:
+        if status_keys_version[0] != state["version"]:
+            # Ключи или сертификаты сменились, возможно в другом воркере
+            status_cache.clear()
+            status_keys_version[0] = state["version"]
+        response = status_cache.get(fingerprint)
+        if response is not None:
+            status_cache.move_to_end(fingerprint)
+    # Отзыв мог прийти в другой воркер, мимо invalidate_status
+    if response is not None and response["status"] != "revoked":
+        if revocations.get(fingerprint) is not None:
+            response = None
+    if response is None or now >= response["this_update"] + STATUS_VALIDITY // 2:
+        version = revocations.version
+        response = sign_status(fingerprint, state)
+        with status_lock:
+            # Отзыв во время подписи мог сделать ответ устаревшим — такой
+            # в кэш не кладём и подписываем заново
+            fresh = revocations.version == version
+            if fresh:
+                status_cache[fingerprint] = response
+                status_cache.move_to_end(fingerprint)
+                while len(status_cache) > STATUS_CACHE_SIZE:
+                    status_cache.popitem(last=False)
+        if not fresh:
+            response = sign_status(fingerprint, state)
+    max_age = max(0, response["next_update"] - now)
+    return JSONResponse(response, headers={"Cache-Control": f"max-age={max_age}"})
+
+
+@app.get("/key_pool")
+def key_pool_stats():
+    return key_pool.stats()
+
+
+@app.get("/http_pool")
+def http_pool_stats():
+    return pool_stats()
+
+
 @app.get("/get_logs")
-def get_logs():
-    # Читаем весь лог и отдаём без временных меток
-    lines = []
-    with open(log_file, "r", encoding="utf-8") as f:
-        for line in f:
-            # Убираем всё до ']' (включительно)
-            if "]" in line:
-                text = line.split("] ", 1)[1].rstrip()
-                lines.append(text)
-    return JSONResponse(lines)
+def get_logs(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=10000),
+    since: Optional[float] = None,
+):
+    # Страница лога без временных меток; курсор следующей страницы — в X-Next-Offset
+    lines, next_offset = read_page(log_file, offset, limit, since)
+    return JSONResponse(lines, headers={"X-Next-Offset": str(next_offset)})
+
+
+@app.get("/get_logs/stream")
+async def stream_logs(request: Request, offset: Optional[int] = Query(None, ge=0)):
+    # Без offset и Last-Event-ID отдаются только строки, появившиеся после
+    # подключения
+    if offset is None:
+        offset = resume_offset(
+            request.headers.get("last-event-id"), os.path.getsize(log_file)
+        )
+    return StreamingResponse(
+        tail(log_file, offset, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
@@ -0,0 +1,162 @@
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from sys import byteorder
+from typing import Dict, List, Optional
+
+from metrics import CERT_STORE_IO_SECONDS
+from tracing import span
+
+_append_timer = CERT_STORE_IO_SECONDS.labels("revocation_append")
+
+
+# Отпечаток — SHA-256 открытого ключа в hex (как в CertLedger)
+FINGERPRINT_PATTERN = "^[0-9a-fA-F]{64}$"
+_fingerprint_re = re.compile(FINGERPRINT_PATTERN)
+
+
+def is_fingerprint(value: str) -> bool:
+    return isinstance(value, str) and _fingerprint_re.fullmatch(value) is not None
+
+
+def fingerprint_prefix(fingerprint: str) -> int:
+    """Первые 64 бита отпечатка — ключ компактного списка отзыва."""
+    return int(fingerprint[:16], 16)
+
+
+class RevocationList:
+    """Список отозванных сертификатов УЦ с номерами версий.
+
+    Каждый отзыв — строка JSON {"seq", "serial", "fingerprint",
+    "revoked_at", "reason"} в дописываемом файле; seq растёт на единицу,
+    поэтому изменения после версии N — это просто хвост списка.
+    Ключ отзыва — отпечаток открытого ключа клиента (как в CertLedger):
+    им подписано само сообщение, и подменить его, в отличие от serial,
+    отправитель не может.
+
+    Клиентам список отдаётся двумя способами: снимком (отсортированные
+    64-битные префиксы отпечатков, 8 байт на запись) и дельтой записей
+    после известной клиенту версии.
+
+    Как и CertLedger, файл может быть общим для нескольких процессов:
+    отзыв пишется под flock, а чтения сначала догружают чужие записи.
+    """
+
+    def __init__(self, path: str, fsync: bool = True):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._entries: List[dict] = []
+        self._by_fingerprint: Dict[str, dict] = {}
+        self._snapshot: Optional[bytes] = None
+        # Конец последней прочитанной строки
+        self._end = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a+b")
+        with self._locked():
+            self._catch_up()
+            self._drop_torn_tail()
+
+    @property
+    def version(self) -> int:
+        with self._lock:
+            self._catch_up()
+            return len(self._entries)
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def _catch_up(self) -> None:
+        fd = self._file.fileno()
+        size = os.fstat(fd).st_size
+        if size <= self._end:
+            return
+        tail = os.pread(fd, size - self._end, self._end)
+        # Строка без перевода строки ещё дописывается (или оборвана)
+        complete = tail[: tail.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            self._index(json.loads(line))
+        self._end += len(complete)
+
+    def _drop_torn_tail(self) -> None:
+        # Под блокировкой строка без перевода строки — хвост от прерванной
+        # записи; новая запись, дописанная за ним, склеилась бы с ним
+        if self._end != os.fstat(self._file.fileno()).st_size:
+            os.truncate(self.path, self._end)
+
+    def _index(self, entry: dict) -> None:
+        self._entries.append(entry)
+        self._by_fingerprint[entry["fingerprint"]] = entry
+        self._snapshot = None
+
+    def revoke(
+        self, fingerprint: str, serial: Optional[int] = None, reason: str = ""
+    ) -> dict:
+        """Отзывает ключ; повторный отзыв возвращает существующую запись."""
+        with self._locked():
+            self._catch_up()
+            entry = self._by_fingerprint.get(fingerprint)
+            if entry is not None:
+                return entry
+            self._drop_torn_tail()
+            entry = {
+                "seq": len(self._entries) + 1,
+                "serial": serial,
+                "fingerprint": fingerprint,
+                "revoked_at": int(time.time()),
+                "reason": reason,
+            }
+            line = json.dumps(entry, separators=(",", ":")).encode() + b"\n"
+            with _append_timer.time(), span("file_io", op="revocation_append"):
+                self._file.write(line)
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            self._index(entry)
+            self._end += len(line)
+            return entry
+
+    def get(self, fingerprint: str) -> Optional[dict]:
+        with self._lock:
+            self._catch_up()
+            return self._by_fingerprint.get(fingerprint)
+
+    def delta(self, since: int, limit: int) -> List[dict]:
+        """Записи с seq > since, не больше limit."""
+        with self._lock:
+            self._catch_up()
+            return self._entries[since : since + limit]
+
+    def snapshot(self) -> tuple:
+        """(версия, отсортированные префиксы отпечатков в big-endian)."""
+        with self._lock:
+            self._catch_up()
+            if self._snapshot is None:
+                # Записи с испорченным отпечатком (до проверки в /revoke)
+                # не должны ломать снимок целиком
+                prefixes = array(
+                    "Q",
+                    sorted(
+                        fingerprint_prefix(f)
+                        for f in self._by_fingerprint
+                        if is_fingerprint(f)
+                    ),
+                )
+                if byteorder == "little":
+                    prefixes.byteswap()
+                self._snapshot = prefixes.tobytes()
+            return len(self._entries), self._snapshot
+
+    def close(self) -> None:
+        self._file.close()
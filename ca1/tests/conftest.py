@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули УЦ импортируются плоско, как в образе (WORKDIR /app)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+from keystore import KeyStore, KeyStoreConflict, KeyStoreLocked
+
+
+def test_update_bumps_version(tmp_path):
+    store = KeyStore(str(tmp_path / "keystore.json"))
+    assert store.load() == {"version": 0}
+    state = store.update({"keys": [1, 2]}, expected_version=0)
+    assert state["version"] == 1
+    assert store.load()["keys"] == [1, 2]
+    assert store.plaintext_secrets
+
+
+def test_stale_version_conflicts(tmp_path):
+    path = str(tmp_path / "keystore.json")
+    first, second = KeyStore(path), KeyStore(path)
+    version = second.load()["version"]
+    first.update({"keys": [1, 2]})
+
+    with pytest.raises(KeyStoreConflict):
+        second.update({"ica_cert": {"subject": "CA1"}}, expected_version=version)
+    # Отклонённая запись ничего не меняет на диске
+    with open(path) as f:
+        assert json.load(f) == {"keys": [1, 2], "version": 1}
+    assert second.load()["version"] == 1
+    assert "ica_cert" not in second.load()
+
+
+def test_sealed_keys(tmp_path):
+    path = str(tmp_path / "keystore.json")
+    KeyStore(path, passphrase="secret").update({"keys": [1, 2]})
+    with open(path) as f:
+        assert "sealed" in json.load(f)["keys"]
+
+    assert KeyStore(path, passphrase="secret").load()["keys"] == [1, 2]
+    with pytest.raises(KeyStoreLocked):
+        KeyStore(path, passphrase="wrong").load()
+    with pytest.raises(KeyStoreLocked):
+        KeyStore(path).load()
@@ -0,0 +1,63 @@
+import os
+
+from ledger import RECORD_HEADER, CertLedger, key_fingerprint
+
+
+def cert(subject: str) -> dict:
+    return {"subject": subject, "issuer": "CA1", "public_key": [3, 55]}
+
+
+def test_append_and_reopen(tmp_path):
+    path = str(tmp_path / "ledger.bin")
+    ledger = CertLedger(path, fsync=False)
+    first, second = ledger.append_many([(cert("a"), [3, 55]), (cert("a"), [5, 77])])
+    ledger.close()
+
+    ledger = CertLedger(path, fsync=False)
+    assert (first["serial"], second["serial"]) == (1, 2)
+    assert len(ledger) == 2
+    assert [r["serial"] for r in ledger.history("a")] == [1, 2]
+    assert ledger.latest("a")["fingerprint"] == key_fingerprint([5, 77])
+    assert ledger.by_fingerprint(key_fingerprint([3, 55]))[0]["serial"] == 1
+    assert ledger.by_serial(3) is None
+
+
+def test_torn_tail_is_dropped(tmp_path):
+    path = str(tmp_path / "ledger.bin")
+    ledger = CertLedger(path, fsync=False)
+    ledger.append(cert("a"), [3, 55])
+    ledger.close()
+    size = os.path.getsize(path)
+    # Прерванная запись: заголовок обещает 100 байт, дописано 10
+    with open(path, "ab") as f:
+        f.write(RECORD_HEADER.pack(100) + b'{"serial":')
+
+    ledger = CertLedger(path, fsync=False)
+    assert os.path.getsize(path) == size
+    assert ledger.append(cert("b"), [5, 77])["serial"] == 2
+    ledger.close()
+
+    ledger = CertLedger(path, fsync=False)
+    assert [ledger.by_serial(n)["certificate"]["subject"] for n in (1, 2)] == [
+        "a",
+        "b",
+    ]
+
+
+def test_catches_up_with_other_writer(tmp_path):
+    path = str(tmp_path / "ledger.bin")
+    reader = CertLedger(path, fsync=False)
+    writer = CertLedger(path, fsync=False)
+    writer.append(cert("a"), [3, 55])
+
+    assert reader.latest("a")["serial"] == 1
+    # Serial выдаётся после догрузки чужих записей
+    assert reader.append(cert("b"), [5, 77])["serial"] == 2
+
+
+def test_import_if_empty_runs_once(tmp_path):
+    path = str(tmp_path / "ledger.bin")
+    ledger = CertLedger(path, fsync=False)
+    assert len(ledger.import_if_empty([(cert("a"), [3, 55])])) == 1
+    assert ledger.import_if_empty([(cert("b"), [5, 77])]) == []
+    assert len(ledger) == 1
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+import struct
+
+from revocation import RevocationList, fingerprint_prefix
+
+
+def fingerprint(n: int) -> str:
+    return hashlib.sha256(str(n).encode()).hexdigest()
+
+
+def test_revoke_is_idempotent(tmp_path):
+    crl = RevocationList(str(tmp_path / "crl.jsonl"), fsync=False)
+    first = crl.revoke(fingerprint(1), serial=1, reason="key compromise")
+    again = crl.revoke(fingerprint(1), serial=7)
+    assert again == first
+    assert crl.version == 1
+    assert crl.get(fingerprint(1))["reason"] == "key compromise"
+
+
+def test_delta_after_version(tmp_path):
+    crl = RevocationList(str(tmp_path / "crl.jsonl"), fsync=False)
+    for n in range(5):
+        crl.revoke(fingerprint(n))
+
+    assert [e["seq"] for e in crl.delta(2, 10)] == [3, 4, 5]
+    assert [e["seq"] for e in crl.delta(0, 2)] == [1, 2]
+    assert crl.delta(5, 10) == []
+
+
+def test_snapshot_is_sorted_big_endian(tmp_path):
+    crl = RevocationList(str(tmp_path / "crl.jsonl"), fsync=False)
+    fingerprints = [fingerprint(n) for n in range(20)]
+    for f in fingerprints:
+        crl.revoke(f)
+
+    version, body = crl.snapshot()
+    assert version == 20
+    prefixes = list(struct.unpack(f">{len(body) // 8}Q", body))
+    assert prefixes == sorted(fingerprint_prefix(f) for f in fingerprints)
+
+    crl.revoke(fingerprint(20))
+    version, body = crl.snapshot()
+    assert (version, len(body)) == (21, 21 * 8)
+
+
+def test_snapshot_skips_bad_fingerprints(tmp_path):
+    path = str(tmp_path / "crl.jsonl")
+    # Запись из времени до проверки отпечатка в /revoke
+    bad = {"seq": 1, "serial": None, "fingerprint": "xyz", "revoked_at": 0}
+    with open(path, "w") as f:
+        f.write(json.dumps(bad) + "\n")
+    crl = RevocationList(path, fsync=False)
+    crl.revoke(fingerprint(1))
+
+    version, body = crl.snapshot()
+    assert version == 2
+    assert body == struct.pack(">Q", fingerprint_prefix(fingerprint(1)))
+
+
+def test_torn_tail_is_dropped(tmp_path):
+    path = str(tmp_path / "crl.jsonl")
+    crl = RevocationList(path, fsync=False)
+    crl.revoke(fingerprint(1))
+    crl.close()
+    size = os.path.getsize(path)
+    with open(path, "ab") as f:
+        f.write(b'{"seq":2,"fingerp')
+
+    crl = RevocationList(path, fsync=False)
+    assert os.path.getsize(path) == size
+    assert crl.revoke(fingerprint(2))["seq"] == 2
+    crl.close()
+    assert [e["seq"] for e in RevocationList(path).delta(0, 10)] == [1, 2]
+
+
+def test_catches_up_with_other_writer(tmp_path):
+    path = str(tmp_path / "crl.jsonl")
+    reader = RevocationList(path, fsync=False)
+    writer = RevocationList(path, fsync=False)
+    writer.revoke(fingerprint(1))
+
+    assert reader.version == 1
+    assert reader.revoke(fingerprint(2))["seq"] == 2
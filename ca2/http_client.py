@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import UPSTREAM_REQUEST_SECONDS, observe_pool
+from tracing import outgoing_headers, span
+
+# Настройки соединений с соседними сервисами
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.2"))
+HTTP_BACKOFF_JITTER = float(os.getenv("HTTP_BACKOFF_JITTER", "0.2"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+
+# Ответы, при которых идемпотентный запрос повторяется
+RETRY_STATUSES = (502, 503, 504)
+
+
+class Upstream:
+    """Сессия requests с пулом keep-alive соединений к одному сервису.
+
+    Повторы с экспоненциальной задержкой и джиттером: для GET — при ошибках
+    соединения, чтения и ответах 502/503/504, для POST — только если
+    соединение не удалось установить (запрос точно не был отправлен).
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        timeout: Tuple[float, float] = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+        retries: int = HTTP_RETRIES,
+        backoff: float = HTTP_BACKOFF,
+        pool_size: int = HTTP_POOL_SIZE,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            backoff_jitter=HTTP_BACKOFF_JITTER,
+            status_forcelist=RETRY_STATUSES,
+            raise_on_status=False,
+        )
+        self._adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        observe_pool(f"http {self.base_url}", self.in_use, pool_size)
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        with self._lock:
+            self.requests += 1
+        url = f"{self.base_url}{path}"
+        start = time.perf_counter()
+        status = "error"
+        with span("http", method=method, url=url) as current:
+            # Контекст трассы уходит дальше в заголовке traceparent
+            kwargs["headers"] = outgoing_headers(kwargs.get("headers"))
+            try:
+                rs = self.session.request(method, url, **kwargs)
+                status = rs.status_code
+                return rs
+            except requests.exceptions.RequestException:
+                with self._lock:
+                    self.errors += 1
+                raise
+            finally:
+                current.set("status", status)
+                UPSTREAM_REQUEST_SECONDS.labels(self.base_url, method, status).observe(
+                    time.perf_counter() - start
+                )
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def in_use(self) -> int:
+        # Соединения, взятые из пулов urllib3 и ещё не возвращённые
+        used = 0
+        for key in list(self._adapter.poolmanager.pools.keys()):
+            pool = self._adapter.poolmanager.pools.get(key)
+            if pool is not None and pool.pool is not None:
+                used += pool.pool.maxsize - pool.pool.qsize()
+        return used
+
+    def stats(self) -> dict:
+        pools = []
+        for key in list(self._adapter.poolmanager.pools.keys()):
+            pool = self._adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            pools.append(
+                {
+                    "host": pool.host,
+                    "port": pool.port,
+                    "connections_opened": pool.num_connections,
+                    "requests": pool.num_requests,
+                    "available": pool.pool.qsize() if pool.pool is not None else 0,
+                    "maxsize": pool.pool.maxsize if pool.pool is not None else 0,
+                }
+            )
+        with self._lock:
+            return {
+                "base_url": self.base_url,
+                "requests": self.requests,
+                "errors": self.errors,
+                "pools": pools,
+            }
+
+
+_upstreams: Dict[str, Upstream] = {}
+_upstreams_lock = threading.Lock()
+
+
+def upstream(base_url: str) -> Upstream:
+    """Общий на процесс Upstream для base_url (например, http://ca1:8001)."""
+    base_url = base_url.rstrip("/")
+    client: Optional[Upstream] = _upstreams.get(base_url)
+    if client is not None:
+        return client
+    with _upstreams_lock:
+        if base_url not in _upstreams:
+            _upstreams[base_url] = Upstream(base_url)
+        return _upstreams[base_url]
+
+
+def pool_stats() -> list:
+    return [client.stats() for client in list(_upstreams.values())]
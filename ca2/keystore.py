@@ -0,0 +1,225 @@
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from metrics import CERT_STORE_IO_SECONDS
+from tracing import span
+
+_write_timer = CERT_STORE_IO_SECONDS.labels("keystore_write")
+
+# Пароль, которым шифруются закрытые ключи в хранилище (или файл с ним,
+# например docker secret); без пароля ключи хранятся открыто, с правами 0600
+KEYSTORE_PASSPHRASE = os.getenv("KEYSTORE_PASSPHRASE")
+KEYSTORE_PASSPHRASE_FILE = os.getenv("KEYSTORE_PASSPHRASE_FILE")
+# Поля состояния с закрытыми ключами
+SECRET_FIELDS = ("keys",)
+SCRYPT_PARAMS = {"n": 1 << 14, "r": 8, "p": 1}
+SEAL_CIPHER = "aes-256-gcm"
+
+
+class KeyStoreConflict(Exception):
+    """Состояние сменилось после того, как запрос его прочитал."""
+
+
+class KeyStoreLocked(Exception):
+    """Ключи зашифрованы, а пароль не задан или не подходит."""
+
+
+def passphrase_from_env() -> Optional[str]:
+    if KEYSTORE_PASSPHRASE_FILE:
+        with open(KEYSTORE_PASSPHRASE_FILE, "r") as f:
+            return f.read().strip()
+    return KEYSTORE_PASSPHRASE or None
+
+
+class Sealer:
+    """Шифрование закрытых ключей паролем: AES-256-GCM из cryptography.
+
+    Ключ AES выводится из пароля и соли через scrypt. GCM проверяет
+    целостность при расшифровке: неверный пароль или испорченный файл
+    дают InvalidTag, а не мусор вместо ключей. scrypt
+    намеренно медленный, поэтому выведенные ключи кэшируются по соли, а
+    соль из файла переиспользуется при следующих записях.
+    """
+
+    def __init__(self, passphrase: str):
+        self._passphrase = passphrase.encode()
+        self._derived: Dict[bytes, AESGCM] = {}
+        self._salt: Optional[bytes] = None
+
+    def _cipher(self, salt: bytes) -> AESGCM:
+        cipher = self._derived.get(salt)
+        if cipher is None:
+            key = hashlib.scrypt(self._passphrase, salt=salt, dklen=32, **SCRYPT_PARAMS)
+            cipher = self._derived[salt] = AESGCM(key)
+        return cipher
+
+    def seal(self, value) -> dict:
+        if self._salt is None:
+            self._salt = os.urandom(16)
+        nonce = os.urandom(12)
+        ciphertext = self._cipher(self._salt).encrypt(
+            nonce, json.dumps(value).encode(), None
+        )
+        return {
+            "kdf": "scrypt",
+            "cipher": SEAL_CIPHER,
+            "salt": self._salt.hex(),
+            "nonce": nonce.hex(),
+            "ciphertext": ciphertext.hex(),
+        }
+
+    def open(self, sealed: dict):
+        if sealed.get("cipher") != SEAL_CIPHER:
+            raise KeyStoreLocked(
+                f"Ключи зашифрованы неподдерживаемым способом: {sealed.get('cipher')}"
+            )
+        salt = bytes.fromhex(sealed["salt"])
+        try:
+            plaintext = self._cipher(salt).decrypt(
+                bytes.fromhex(sealed["nonce"]), bytes.fromhex(sealed["ciphertext"]), None
+            )
+        except InvalidTag:
+            raise KeyStoreLocked("Неверный пароль хранилища или файл повреждён")
+        self._salt = salt
+        return json.loads(plaintext)
+
+
+def is_sealed(value) -> bool:
+    return isinstance(value, dict) and "sealed" in value
+
+
+class KeyStore:
+    """Ключи УЦ и связанное с ними состояние в файле, общем для воркеров.
+
+    Состояние — JSON {"version", "keys", ...}; файл целиком заменяется
+    через временный файл и os.replace, поэтому читатель видит либо старую
+    версию, либо новую, и ключи с сертификатом меняются вместе. Писатели
+    сериализуются flock на соседнем .lock-файле. Каждый процесс держит
+    разобранную копию и перечитывает файл, только когда сменились его
+    inode, mtime или размер: одна os.stat на обращение.
+
+    С паролем поля SECRET_FIELDS лежат на диске зашифрованными
+    ({"sealed": ...}), а в памяти процесса — расшифрованными.
+    """
+
+    def __init__(self, path: str, passphrase: Optional[str] = None):
+        self.path = path
+        self._sealer = Sealer(passphrase) if passphrase else None
+        # Есть ли на диске закрытые ключи в открытом виде
+        self.plaintext_secrets = False
+        self._lock = threading.Lock()
+        self._state: dict = {"version": 0}
+        self._stamp: Optional[tuple] = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock_file = open(path + ".lock", "a")
+
+    @staticmethod
+    def _stamp_of(stat: os.stat_result) -> tuple:
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    @property
+    def encrypted(self) -> bool:
+        return self._sealer is not None
+
+    def _read_file(self) -> None:
+        try:
+            with open(self.path, "r") as f:
+                stamp = self._stamp_of(os.fstat(f.fileno()))
+                state = json.load(f)
+        except FileNotFoundError:
+            stamp, state = None, {"version": 0}
+        plaintext = False
+        for field in SECRET_FIELDS:
+            value = state.get(field)
+            if is_sealed(value):
+                if self._sealer is None:
+                    raise KeyStoreLocked(
+                        "Ключи в хранилище зашифрованы, задайте KEYSTORE_PASSPHRASE"
+                    )
+                state[field] = self._sealer.open(value["sealed"])
+            elif value:
+                plaintext = True
+        self._state, self._stamp = state, stamp
+        self.plaintext_secrets = plaintext
+
+    def load(self) -> dict:
+        """Текущее состояние; возвращаемый словарь менять нельзя."""
+        try:
+            stamp = self._stamp_of(os.stat(self.path))
+        except FileNotFoundError:
+            stamp = None
+        if stamp == self._stamp:
+            return self._state
+        with self._lock:
+            if stamp != self._stamp:
+                self._read_file()
+            return self._state
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def update(self, changes: dict, expected_version: Optional[int] = None) -> dict:
+        """Атомарно применяет changes и увеличивает version.
+
+        С expected_version запись отклоняется (KeyStoreConflict), если
+        состояние успело смениться, — например, ключи ротировали, пока
+        запрос подписывал сертификат старым ключом.
+        """
+        with self._locked():
+            self._read_file()
+            current = self._state
+            if expected_version is not None and current["version"] != expected_version:
+                raise KeyStoreConflict(
+                    f"Ожидалась версия {expected_version}, на диске {current['version']}"
+                )
+            state = {**current, **changes, "version": current["version"] + 1}
+            stored = dict(state)
+            if self._sealer is not None:
+                for field in SECRET_FIELDS:
+                    if stored.get(field):
+                        stored[field] = {"sealed": self._sealer.seal(stored[field])}
+            directory = os.path.dirname(self.path) or "."
+            # mkstemp создаёт файл с правами 0600: в нём закрытые ключи
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".keystore-")
+            try:
+                with _write_timer.time(), span("file_io", op="keystore_write"):
+                    with os.fdopen(fd, "w") as f:
+                        json.dump(stored, f)
+                        f.flush()
+                        os.fsync(f.fileno())
+                        stamp = self._stamp_of(os.fstat(f.fileno()))
+                    os.replace(tmp_path, self.path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+            self._state, self._stamp = state, stamp
+            self.plaintext_secrets = self._sealer is None and any(
+                state.get(field) for field in SECRET_FIELDS
+            )
+            return state
+
+    def discard(self, reason: str) -> str:
+        """Убирает непригодное хранилище в сторону; дальше — холодный старт."""
+        with self._locked():
+            target = f"{self.path}.invalid-{int(time.time())}"
+            if os.path.exists(self.path):
+                os.replace(self.path, target)
+            self._state, self._stamp = {"version": 0}, None
+            return target
@@ -0,0 +1,184 @@
+import fcntl
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from metrics import CERT_STORE_IO_SECONDS
+from tracing import span
+
+# Заголовок записи: длина тела в байтах (uint32, big-endian)
+RECORD_HEADER = struct.Struct(">I")
+
+_append_timer = CERT_STORE_IO_SECONDS.labels("ledger_append")
+
+
+def key_fingerprint(public_key: List[int]) -> str:
+    e, n = public_key
+    return hashlib.sha256(f"{e}|{n}".encode()).hexdigest()
+
+
+class CertLedger:
+    """Журнал выданных сертификатов: одна дописываемая запись на выпуск.
+
+    Запись — 4 байта длины и JSON {"serial", "issued_at", "fingerprint",
+    "certificate"}. Индексы по subject, serial и отпечатку ключа держатся
+    в памяти (смещения записей) и перестраиваются из файла при запуске.
+    Повторный выпуск не затирает прошлый — история по subject сохраняется.
+
+    Файл может быть общим для нескольких процессов (uvicorn --workers):
+    запись идёт под flock, а перед выдачей serial и перед поиском индекс
+    догружается записями, которые дописали другие процессы.
+    """
+
+    def __init__(self, path: str, fsync: bool = True):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._by_serial: Dict[int, int] = {}
+        self._by_subject: Dict[str, List[int]] = {}
+        self._by_fingerprint: Dict[str, List[int]] = {}
+        self._last_serial = 0
+        # Конец последней проиндексированной записи
+        self._end = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a+b")
+        with self._locked():
+            self._catch_up()
+            self._drop_torn_tail()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._catch_up()
+            return len(self._by_serial)
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def _index(self, record: dict, offset: int) -> None:
+        self._by_serial[record["serial"]] = offset
+        self._by_subject.setdefault(record["certificate"]["subject"], []).append(
+            offset
+        )
+        self._by_fingerprint.setdefault(record["fingerprint"], []).append(offset)
+        self._last_serial = max(self._last_serial, record["serial"])
+
+    def _catch_up(self) -> None:
+        """Индексирует полные записи после self._end (одна fstat, если их нет)."""
+        fd = self._file.fileno()
+        size = os.fstat(fd).st_size
+        offset = self._end
+        while offset + RECORD_HEADER.size <= size:
+            (length,) = RECORD_HEADER.unpack(os.pread(fd, RECORD_HEADER.size, offset))
+            end = offset + RECORD_HEADER.size + length
+            if end > size:
+                break
+            body = os.pread(fd, length, offset + RECORD_HEADER.size)
+            self._index(json.loads(body), offset)
+            offset = end
+        self._end = offset
+
+    def _drop_torn_tail(self) -> None:
+        # Под блокировкой недописанных записей нет: байты после последней
+        # полной записи — хвост от прерванной записи, отрезаем. Иначе файл,
+        # открытый на дозапись, писал бы за ним, и смещения в индексе
+        # разошлись бы с файлом
+        if self._end != os.fstat(self._file.fileno()).st_size:
+            os.truncate(self.path, self._end)
+
+    def _read(self, offset: int) -> dict:
+        fd = self._file.fileno()
+        (length,) = RECORD_HEADER.unpack(os.pread(fd, RECORD_HEADER.size, offset))
+        return json.loads(os.pread(fd, length, offset + RECORD_HEADER.size))
+
+    def append_many(self, entries: List[tuple]) -> List[dict]:
+        """Дописывает пары (certificate, subject_public_key) одной записью на диск.
+
+        Возвращает записи журнала с присвоенными serial.
+        """
+        with self._locked():
+            return self._append_locked(entries)
+
+    def import_if_empty(self, entries: List[tuple]) -> List[dict]:
+        """Дописывает entries, только если журнал пуст; иначе возвращает [].
+
+        Проверка и запись — под одной блокировкой: перенос старых
+        сертификатов при старте нескольких воркеров выполнит ровно один.
+        """
+        with self._locked():
+            self._catch_up()
+            if self._by_serial:
+                return []
+            return self._append_locked(entries)
+
+    def _append_locked(self, entries: List[tuple]) -> List[dict]:
+        # Вызывается под self._locked()
+        self._catch_up()
+        self._drop_torn_tail()
+        offset = self._end
+        issued_at = int(time.time())
+        records, chunks, offsets = [], [], []
+        for certificate, subject_key in entries:
+            self._last_serial += 1
+            record = {
+                "serial": self._last_serial,
+                "issued_at": issued_at,
+                "fingerprint": key_fingerprint(subject_key),
+                "certificate": certificate,
+            }
+            body = json.dumps(record, separators=(",", ":")).encode()
+            chunks.append(RECORD_HEADER.pack(len(body)))
+            chunks.append(body)
+            records.append(record)
+            offsets.append(offset)
+            offset += RECORD_HEADER.size + len(body)
+        with _append_timer.time(), span("file_io", op="ledger_append"):
+            self._file.write(b"".join(chunks))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        for record, record_offset in zip(records, offsets):
+            self._index(record, record_offset)
+        self._end = offset
+        return records
+
+    def append(self, certificate: dict, subject_key: List[int]) -> dict:
+        return self.append_many([(certificate, subject_key)])[0]
+
+    def _offsets(self, index: dict, key) -> list:
+        with self._lock:
+            self._catch_up()
+            return list(index.get(key, []))
+
+    def by_serial(self, serial: int) -> Optional[dict]:
+        with self._lock:
+            self._catch_up()
+            offset = self._by_serial.get(serial)
+        return self._read(offset) if offset is not None else None
+
+    def history(self, subject: str) -> List[dict]:
+        offsets = self._offsets(self._by_subject, subject)
+        return [self._read(offset) for offset in offsets]
+
+    def latest(self, subject: str) -> Optional[dict]:
+        offsets = self._offsets(self._by_subject, subject)
+        return self._read(offsets[-1]) if offsets else None
+
+    def by_fingerprint(self, fingerprint: str) -> List[dict]:
+        return [
+            self._read(offset)
+            for offset in self._offsets(self._by_fingerprint, fingerprint)
+        ]
+
+    def close(self) -> None:
+        self._file.close()
@@ -0,0 +1,187 @@
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional, Tuple
+
+# Доля запросов, для которых записываются спаны (решение принимает
+# первый сервис в цепочке и передаёт его дальше во флагах traceparent)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1"))
+# Сколько последних спанов хранится в памяти для /traces
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", "10000"))
+# Файл, куда дописываются завершённые спаны (JSON lines); пусто — не писать
+TRACE_FILE = os.getenv("TRACE_FILE")
+
+service_name = "unknown"
+_spans: deque = deque(maxlen=TRACE_BUFFER)
+_file = open(TRACE_FILE, "a", buffering=1) if TRACE_FILE else None
+_file_lock = threading.Lock()
+# Текущий спан; None — трассировки нет
+_current: contextvars.ContextVar = contextvars.ContextVar("span", default=None)
+
+
+class Span:
+    """Спан трассы; в несэмплированной трассе только передаёт traceparent."""
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        attributes: dict,
+        sampled: bool = True,
+    ):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.sampled = sampled
+
+    def set(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def __enter__(self) -> "Span":
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._started
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        if self.sampled:
+            _record(self)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_dict(self) -> dict:
+        return {
+            "service": service_name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": self.duration * 1000,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    def set(self, key: str, value) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+NOOP = _NoopSpan()
+
+
+def _record(span: Span) -> None:
+    _spans.append(span)
+    if _file is not None:
+        line = json.dumps(span.to_dict(), ensure_ascii=False)
+        with _file_lock:
+            _file.write(line + "\n")
+
+
+def spans(trace_id: Optional[str] = None, limit: int = 1000) -> list:
+    found = [s for s in list(_spans) if not trace_id or s.trace_id == trace_id]
+    return [s.to_dict() for s in found[-limit:]]
+
+
+def span(name: str, **attributes):
+    """Дочерний спан текущей трассы; вне сэмплированной трассы — заглушка."""
+    parent = _current.get()
+    if parent is None or not parent.sampled:
+        return NOOP
+    return Span(name, parent.trace_id, parent.span_id, attributes)
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    # Формат W3C: 00-<trace_id 32 hex>-<parent_id 16 hex>-<flags 2 hex>
+    parts = (value or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = int(parts[3], 16) & 1 == 1
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+def start_trace(name: str, traceparent: Optional[str] = None, **attributes) -> Span:
+    """Корневой спан запроса: продолжает входящую трассу или начинает новую."""
+    parsed = parse_traceparent(traceparent)
+    if parsed is None:
+        sampled = random.random() < TRACE_SAMPLE_RATE
+        parsed = f"{random.getrandbits(128):032x}", None, sampled
+    trace_id, parent_id, sampled = parsed
+    return Span(name, trace_id, parent_id, attributes, sampled)
+
+
+def outgoing_headers(headers: Optional[dict] = None) -> Optional[dict]:
+    """Заголовки исходящего запроса с traceparent текущего спана."""
+    current = _current.get()
+    if current is None:
+        return headers
+    return {**(headers or {}), "traceparent": current.traceparent()}
+
+
+def bind(fn: Callable) -> Callable:
+    """Функция для пула потоков, выполняющаяся в контексте текущей трассы."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+class TracingMiddleware:
+    """ASGI-middleware: корневой спан на каждый входящий HTTP-запрос."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        traceparent = headers.get(b"traceparent", b"").decode("latin-1")
+        root = start_trace(scope["method"], traceparent)
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                root.set("status", message["status"])
+                headers = list(message.get("headers", []))
+                headers.append((b"traceparent", root.traceparent().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        with root:
+            try:
+                await self.app(scope, receive, send_with_trace)
+            finally:
+                route = getattr(scope.get("route"), "path", scope["path"])
+                root.name = f"{scope['method']} {route}"
+
+
+def instrument(app, service: str) -> None:
+    """Подключает трассировку и эндпоинт /traces к приложению FastAPI."""
+    global service_name
+    service_name = service
+    app.add_middleware(TracingMiddleware)
+
+    @app.get("/traces", include_in_schema=False)
+    def traces(trace_id: Optional[str] = None, limit: int = 1000):
+        return spans(trace_id, limit)
@@ -5,14 +5,6 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def custom_hash(data_str: str, n: int) -> int:
-    hash_val = 5381
-    for c in data_str:
-        hash_val = ((hash_val * 33) + ord(c)) ^ (hash_val >> 8)
-        hash_val = (hash_val * 0x9E3779B9) % n
-    return hash_val % n
-
-
 class Certificate:
     def __init__(self, data: Dict[str, Any]):
         self.subject = data.get("subject", "")
@@ -0,0 +1,14 @@
+import fastapi
+
+from usecases.dtos import CertBundle
+
+
+def get_cert_bundle(request: fastapi.Request) -> CertBundle:
+    try:
+        return request.app.state.cert_store.get()
+    except FileNotFoundError:
+        raise fastapi.HTTPException(
+            status_code=409,
+            detail="Сертификаты не получены: вызовите /certs/all_certs "
+            "и /certs/generate_keys_and_cert",
+        )
@@ -5,6 +5,19 @@ import uvicorn
 import dynaconf
 from routers.certs import router_certificate
 from routers.message import message_router
+from usecases.cert_status import stapler, status_cache
+from usecases.cert_store import cert_store
+from usecases.discovery import (
+    CLIENT_ID,
+    CLIENT_PORT,
+    resolver,
+    start_heartbeat,
+    stop_heartbeat,
+)
+from usecases.get_messages import shutdown_executor, start_executor
+from usecases.http_client import pool_stats
+from usecases.revocation import revocations, start_sync, stop_sync
+from usecases import metrics, tracing
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse, JSONResponse
@@ -16,6 +29,8 @@ logging.basicConfig(level=0)
 
 
 app = FastAPI()
+metrics.instrument(app)
+tracing.instrument(app, CLIENT_ID or "client")
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
@@ -24,8 +39,21 @@ templates = Jinja2Templates(directory="templates")
 conf = dynaconf.Dynaconf(settings_files="config.toml")
 app.state.recv_msg = "Нет сообщений"
 app.state.recv_check = "Нечего проверять"
+app.state.cert_store = cert_store
+try:
+    cert_store.get()
+except FileNotFoundError:
+    logging.info("Сертификаты ещё не получены, store будет заполнен позже")
 app.include_router(router_certificate, tags=["certs"])
 app.include_router(message_router, tags=["message"])
+app.on_event("startup")(start_executor)
+app.on_event("shutdown")(shutdown_executor)
+app.on_event("startup")(start_heartbeat)
+app.on_event("shutdown")(stop_heartbeat)
+app.on_event("startup")(start_sync)
+app.on_event("shutdown")(stop_sync)
+app.on_event("startup")(stapler.start)
+app.on_event("shutdown")(stapler.stop)
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -40,4 +68,33 @@ def index(request: Request):
     )
 
 
-uvicorn.run(app, host="0.0.0.0", port=8000)
+@app.get("/http_pool")
+def http_pool_stats():
+    return pool_stats()
+
+
+@app.get("/discovery")
+def discovery_stats():
+    return resolver.stats()
+
+
+@app.get("/revocation")
+def revocation_stats():
+    return revocations.stats()
+
+
+@app.get("/cert_status")
+def cert_status_stats():
+    return {**stapler.stats(), "cache": status_cache.stats()}
+
+
+@app.post("/revocation/sync")
+def revocation_sync():
+    # Не дожидаясь периодического обновления
+    revocations.sync_all()
+    return revocations.stats()
+
+
+# Процессы проверки пакетов импортируют этот модуль заново — без сервера
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=CLIENT_PORT)
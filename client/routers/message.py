@@ -1,17 +1,59 @@
 import logging
-from typing import Optional
-from fastapi import APIRouter, Depends, Request, Query
-from usecases.dtos import IncomingMessage
+from typing import List, Optional
+import pydantic
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
+from fastapi.concurrency import run_in_threadpool
+from usecases.dtos import CertBundle, IncomingMessage
+from dependencies.cert_store import get_cert_bundle
 from dependencies.db_connection import get_db_connection
 from usecases.get_message import get_message_usecase
-from usecases.send_mesage import send_message_usecase
+from usecases.get_messages import get_messages_usecase
+from usecases.send_mesage import SEND_VIA_RELAY, send_message_usecase
+from usecases.broadcast_message import broadcast_message_usecase
+from usecases.verify_cache import verification_cache
 
 message_router = APIRouter(prefix="/message")
 
 
 @message_router.post("/get_message")
-def get_message(request: Request, msg: IncomingMessage):
-    return get_message_usecase(request, msg)
+def get_message(
+    request: Request,
+    msg: IncomingMessage,
+    certs: CertBundle = Depends(get_cert_bundle),
+):
+    return get_message_usecase(request, msg, certs)
+
+
+_message_list = pydantic.TypeAdapter(List[IncomingMessage])
+
+
+def parse_messages(body: bytes, content_type: str) -> List[IncomingMessage]:
+    # Пакет приходит JSON-массивом или NDJSON (одно сообщение на строку)
+    if "ndjson" in content_type:
+        return [
+            IncomingMessage.model_validate_json(line)
+            for line in body.splitlines()
+            if line.strip()
+        ]
+    return _message_list.validate_json(body)
+
+
+@message_router.post("/get_messages")
+async def get_messages(
+    request: Request,
+    certs: CertBundle = Depends(get_cert_bundle),
+):
+    body = await request.body()
+    # Разбор и валидация всего пакета — тоже в пуле потоков, а не в цикле событий
+    return await run_in_threadpool(receive_messages, request, body, certs)
+
+
+def receive_messages(request: Request, body: bytes, certs: CertBundle):
+    try:
+        messages = parse_messages(body, request.headers.get("content-type", ""))
+    except pydantic.ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+    return get_messages_usecase(request, messages, certs)
 
 
 @message_router.post("/send_message")
@@ -20,5 +62,32 @@ def send_message(
     msg: str = Query(...),
     override_r: Optional[int] = None,
     override_s: Optional[int] = None,
+    # Через ретранслятор api: ответ 202, доставка — в фоне
+    via_relay: bool = Query(SEND_VIA_RELAY),
+    certs: CertBundle = Depends(get_cert_bundle),
+):
+    return send_message_usecase(
+        client_id, msg, certs, override_r, override_s, via_relay
+    )
+
+
+@message_router.post("/broadcast_message")
+def broadcast_message(
+    msg: str = Query(...),
+    client_ids: Optional[List[str]] = Query(None),
+    via_relay: bool = Query(SEND_VIA_RELAY),
+    certs: CertBundle = Depends(get_cert_bundle),
 ):
-    return send_message_usecase(client_id, msg, override_r, override_s)
+    # Без client_ids сообщение уходит всем известным клиентам
+    return broadcast_message_usecase(msg, certs, client_ids, via_relay)
+
+
+@message_router.get("/verify_cache")
+def verify_cache_stats():
+    return verification_cache.stats()
+
+
+@message_router.delete("/verify_cache")
+def verify_cache_invalidate():
+    verification_cache.invalidate()
+    return verification_cache.stats()
@@ -4,19 +4,42 @@ import os
 from typing import Dict, Any
 import logging
 from cert import RootCertificate, IntermediateCertificate
+from usecases.cert_store import cert_store
+from usecases.discovery import ca_url as resolve_ca_url
+from usecases.http_client import upstream
+from usecases.known_certs import known_certs
+from usecases.verify_cache import verification_cache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SAVE_DIR = "certs"
+
+# Последний успешно принятый ответ УЦ: {"etag", "result"}
+last_bundle: Dict[str, Any] = {}
+
+
+def bundle_files_exist() -> bool:
+    return all(
+        os.path.exists(f"{SAVE_DIR}/{name}.json") for name in ("root_cert", "ica_cert")
+    )
+
 
 def all_certs_usecase() -> Dict[str, Any]:
     try:
-        ca = os.getenv("MY_CA")
-        external_endpoint = f"http://{ca}:8001/all_certs"
-        logger.info("Получаю сертификат УЦ и корневого УЦ: %s", external_endpoint)
-        response = requests.get(external_endpoint, timeout=10)
+        ca_url = resolve_ca_url()
+        logger.info("Получаю сертификат УЦ и корневого УЦ: %s/all_certs", ca_url)
+        headers = {}
+        if last_bundle and bundle_files_exist():
+            headers["If-None-Match"] = last_bundle["etag"]
+        response = upstream(ca_url).get("/all_certs", headers=headers)
         response.raise_for_status()
 
+        if response.status_code == 304:
+            # Цепочка не менялась — повторный разбор и проверка не нужны
+            logger.info("Сертификаты УЦ не изменились (ETag %s)", last_bundle["etag"])
+            return last_bundle["result"]
+
         certs_data = response.json()
         logger.info("Полученные сертификаты: %s", certs_data)
 
@@ -35,7 +58,7 @@ def all_certs_usecase() -> Dict[str, Any]:
             cert.validate()
             certs.append(cert)
 
-        save_dir = "certs"
+        save_dir = SAVE_DIR
         if not os.path.exists(save_dir):
             os.makedirs(save_dir)
 
@@ -61,11 +84,21 @@ def all_certs_usecase() -> Dict[str, Any]:
             saved_files.append(filename)
             logger.info("Сертификат сохранен: %s", filename)
 
-        return {
+        # Доверенные сертификаты сменились — старые вердикты недействительны
+        cert_store.invalidate()
+        verification_cache.invalidate()
+        known_certs.clear()
+
+        result = {
             "status": "success",
             "message": f"Сертификаты сохранены: {saved_files}",
             "certs": certs_data,
         }
+        last_bundle.clear()
+        etag = response.headers.get("ETag")
+        if etag:
+            last_bundle.update({"etag": etag, "result": result})
+        return result
 
     except requests.exceptions.RequestException as e:
         logger.error("Не получил доступ к сертификатам: %s", str(e))
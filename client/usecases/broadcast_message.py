@@ -0,0 +1,115 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from typing import List, Optional
+
+import requests
+from fastapi.responses import JSONResponse
+
+from usecases.discovery import CLIENT_ID, Peer, peer_name, resolver
+from usecases.dtos import CertBundle
+from usecases.metrics import observe_pool
+from usecases.tracing import bind
+from usecases.send_mesage import (
+    SEND_VIA_RELAY,
+    build_message,
+    deliver_message,
+    relay_message,
+    response_check,
+)
+
+logger = logging.getLogger(__name__)
+
+# Клиенты (номера N в адресе clientN), которым уходит рассылка "всем",
+# если реестр не задан или недоступен
+KNOWN_PEERS = [
+    int(peer) for peer in os.getenv("KNOWN_PEERS", "1,2,3,4").split(",") if peer.strip()
+]
+# Сколько доставок выполняется одновременно во всех рассылках вместе
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "8"))
+
+# Один пул на процесс: параллельные рассылки делят BROADCAST_CONCURRENCY,
+# а не умножают его
+_executor = ThreadPoolExecutor(
+    max_workers=max(1, BROADCAST_CONCURRENCY), thread_name_prefix="broadcast"
+)
+
+# Доставки, выполняющиеся сейчас во всех рассылках
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+observe_pool("broadcast", lambda: _in_flight, BROADCAST_CONCURRENCY)
+
+
+def _track(count: int) -> None:
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += count
+
+
+def deliver(client_id: Peer, full_body: str, ref_body: str, via_relay: bool) -> dict:
+    _track(1)
+    try:
+        if via_relay:
+            rs = relay_message(client_id, full_body)
+            return {
+                "client_id": client_id,
+                "status": rs.status_code,
+                "relay_id": rs.json().get("id"),
+            }
+        rs = deliver_message(client_id, full_body, ref_body)
+        return {
+            "client_id": client_id,
+            "status": rs.status_code,
+            "check": response_check(rs),
+        }
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.error("Не удалось доставить сообщение клиенту %s: %s", client_id, e)
+        # Адрес мог смениться — в следующий раз спросим реестр заново
+        resolver.invalidate(peer_name(client_id))
+        return {"client_id": client_id, "status": None, "error": str(e)}
+    finally:
+        _track(-1)
+
+
+def broadcast_message_usecase(
+    message: str,
+    certs: CertBundle,
+    client_ids: Optional[List[Peer]] = None,
+    via_relay: bool = SEND_VIA_RELAY,
+):
+    # Себе не рассылаем: без реестра KNOWN_PEERS включает и этого клиента
+    recipients = [
+        peer
+        for peer in dict.fromkeys(client_ids or resolver.peers(KNOWN_PEERS))
+        if not CLIENT_ID or peer_name(peer) != CLIENT_ID
+    ]
+    # Подпись и сериализация — один раз на всю рассылку
+    msg = build_message(message, certs)
+    full_body = msg.model_dump_json(exclude_none=True)
+    ref_body = msg.by_reference().model_dump_json(exclude_none=True)
+
+    results = list(
+        _executor.map(
+            bind(deliver),
+            recipients,
+            repeat(full_body, len(recipients)),
+            repeat(ref_body, len(recipients)),
+            repeat(via_relay, len(recipients)),
+        )
+    )
+
+    delivered = sum(1 for result in results if result["status"] == 200)
+    # Принятые ретранслятором доставятся позже, их статус — в api
+    queued = sum(1 for result in results if result["status"] == 202)
+    return JSONResponse(
+        {
+            "message": msg.message,
+            "signature": msg.signature.model_dump(),
+            "delivered": delivered,
+            "queued": queued,
+            "failed": len(results) - delivered - queued,
+            "results": results,
+        }
+    )
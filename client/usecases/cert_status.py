@@ -0,0 +1,295 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import pydantic
+import requests
+
+from usecases.cert_store import cert_store
+from usecases.crypto_utils import check_signature, construct_status_str
+from usecases.discovery import ca_url, resolver
+from usecases.dtos import Certificate, CertStatus, IncomingMessage
+from usecases.http_client import upstream
+from usecases.revocation import REVOCATION_CAS, key_fingerprint
+
+logger = logging.getLogger(__name__)
+
+STATUS_CACHE_SIZE = int(os.getenv("STATUS_CACHE_SIZE", "4096"))
+# Допустимое расхождение часов с УЦ при проверке окна действия ответа
+STATUS_CLOCK_SKEW = int(os.getenv("STATUS_CLOCK_SKEW", "60"))
+# Наибольшее окно действия ответа; должно совпадать с STATUS_VALIDITY УЦ
+STATUS_VALIDITY = int(os.getenv("STATUS_VALIDITY", "300"))
+# Как часто проверяется, не пора ли обновить собственный ответ
+STAPLE_CHECK_INTERVAL = float(os.getenv("STAPLE_CHECK_INTERVAL", "5"))
+# Потоки фоновых запросов статуса к УЦ при промахе кэша
+STATUS_FETCH_WORKERS = int(os.getenv("STATUS_FETCH_WORKERS", "4"))
+# Принимать сообщения только с действительным ответом "good" (вложенным
+# или полученным от УЦ ранее); иначе достаточно проверки по списку отзыва
+STATUS_REQUIRED = os.getenv("STATUS_REQUIRED", "").lower() in ("1", "true", "yes")
+
+REVOKED = "revoked"
+GOOD = "good"
+
+
+def status_is_fresh(status: CertStatus, now: float) -> bool:
+    # Ответ из будущего или с окном длиннее STATUS_VALIDITY УЦ не выдаёт:
+    # иначе один ответ закрепил бы статус в кэше на годы
+    return (
+        0 < status.next_update - status.this_update <= STATUS_VALIDITY
+        and status.this_update - STATUS_CLOCK_SKEW
+        <= now
+        < status.next_update + STATUS_CLOCK_SKEW
+    )
+
+
+class StatusCache:
+    """Проверенные ответы УЦ о статусе ключей отправителей.
+
+    Ответы приходят вложенными в сообщения (staple) и хранятся до
+    next_update; подпись повторно присланного ответа не проверяется.
+    Если нет ни ответа, ни записи в кэше, или вложенный ответ старше
+    половины срока (свежий отправитель обновляет его раньше), получатель
+    сам запрашивает статус у УЦ в фоне. Текущее сообщение этого не ждёт:
+    его статус неизвестен, и остаётся проверка по списку отзыва, а
+    следующие сообщения того же ключа проверяются по ответу УЦ.
+
+    Ответ принимается только от issuer — сертификата УЦ, уже проверенного
+    по нашему корневому: он должен быть подписан его ключом и назван его
+    subject. Ключу УЦ из самого сообщения без такой проверки верить нельзя.
+    """
+
+    def __init__(
+        self, maxsize: int = STATUS_CACHE_SIZE, workers: int = STATUS_FETCH_WORKERS
+    ):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, CertStatus]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        # Отпечатки, за статусом которых уже пошли к УЦ
+        self._fetching: set = set()
+        # subject сертификата УЦ -> имя сервиса УЦ, узнаётся по первому ответу
+        self._issuers: Dict[str, str] = {}
+        self.hits = 0
+        self.verified = 0
+        self.rejected = 0
+        self.fetched = 0
+        self.fetch_errors = 0
+
+    def _verify(
+        self, staple: CertStatus, fingerprint: str, issuer: Certificate
+    ) -> bool:
+        e, n = issuer.public_key
+        return (
+            staple.ca == issuer.subject
+            and staple.fingerprint == fingerprint
+            and status_is_fresh(staple, time.time())
+            and check_signature(
+                staple.signature,
+                construct_status_str(
+                    staple.ca,
+                    staple.fingerprint,
+                    staple.status,
+                    staple.this_update,
+                    staple.next_update,
+                ),
+                e,
+                n,
+            )
+        )
+
+    def check(self, message: IncomingMessage, issuer: Certificate) -> Optional[str]:
+        """Статус ключа отправителя ("good", "revoked", ...) или None.
+
+        Вызывается только для сообщения с уже проверенной подписью.
+        """
+        fingerprint = key_fingerprint(message.public_keys)
+        now = time.time()
+        staple = message.staple
+        with self._lock:
+            cached = self._entries.get(fingerprint)
+            if cached is not None and cached.next_update + STATUS_CLOCK_SKEW <= now:
+                del self._entries[fingerprint]
+                cached = None
+            if cached is not None and cached.ca != issuer.subject:
+                # Ответ другого УЦ о том же ключе к этому сообщению не относится
+                cached = None
+            if cached is not None and (
+                staple is None
+                or staple.signature == cached.signature
+                or staple.this_update <= cached.this_update
+            ):
+                self._entries.move_to_end(fingerprint)
+                self.hits += 1
+                return cached.status
+
+        if staple is None:
+            self.fetch(fingerprint, issuer)
+            return None
+        if not self._verify(staple, fingerprint, issuer):
+            # Просроченный или чужой ответ — как будто его нет
+            with self._lock:
+                self.rejected += 1
+            if cached is not None:
+                return cached.status
+            self.fetch(fingerprint, issuer)
+            return None
+        with self._lock:
+            self.verified += 1
+        self._store(fingerprint, staple)
+        if now - staple.this_update > STATUS_VALIDITY / 2:
+            # Ответ мог быть получен до отзыва — уточняем у УЦ
+            self.fetch(fingerprint, issuer)
+        return staple.status
+
+    def _store(self, fingerprint: str, status: CertStatus) -> None:
+        with self._lock:
+            cached = self._entries.get(fingerprint)
+            if (
+                cached is not None
+                and cached.ca == status.ca
+                and cached.this_update >= status.this_update
+            ):
+                return
+            self._entries[fingerprint] = status
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _candidates(self, subject: str) -> List[str]:
+        with self._lock:
+            known = self._issuers.get(subject)
+        return [known] if known is not None else resolver.cas(REVOCATION_CAS)
+
+    def fetch(self, fingerprint: str, issuer: Certificate) -> None:
+        """Запрашивает статус ключа у УЦ в фоне; повторные запросы склеиваются."""
+        with self._lock:
+            if fingerprint in self._fetching:
+                return
+            self._fetching.add(fingerprint)
+        try:
+            self._executor.submit(self._fetch, fingerprint, issuer)
+        except RuntimeError:
+            # Пул уже остановлен
+            with self._lock:
+                self._fetching.discard(fingerprint)
+
+    def _fetch(self, fingerprint: str, issuer: Certificate) -> None:
+        try:
+            # Имя сервиса УЦ по subject заранее не известно: спрашиваем УЦ
+            # по очереди, чужой ответ не пройдёт проверку подписи issuer
+            for ca in self._candidates(issuer.subject):
+                try:
+                    rs = upstream(ca_url(ca)).get(f"/status/{fingerprint}")
+                    rs.raise_for_status()
+                    status = CertStatus.model_validate_json(rs.content)
+                except (
+                    requests.exceptions.RequestException,
+                    pydantic.ValidationError,
+                ) as e:
+                    logger.warning("Статус %s от %s не получен: %s", fingerprint, ca, e)
+                    continue
+                if not self._verify(status, fingerprint, issuer):
+                    continue
+                with self._lock:
+                    self._issuers[issuer.subject] = ca
+                    self.fetched += 1
+                self._store(fingerprint, status)
+                return
+            with self._lock:
+                self.fetch_errors += 1
+        finally:
+            with self._lock:
+                self._fetching.discard(fingerprint)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "verified": self.verified,
+                "rejected": self.rejected,
+                "fetched": self.fetched,
+                "fetch_errors": self.fetch_errors,
+                "fetching": len(self._fetching),
+                "required": STATUS_REQUIRED,
+            }
+
+
+status_cache = StatusCache()
+
+
+class Stapler:
+    """Ответ УЦ о статусе собственного ключа для вложения в сообщения.
+
+    Обновляется фоновым потоком, когда прошла половина срока действия,
+    поэтому отправка сообщения никогда не ждёт УЦ.
+    """
+
+    def __init__(self):
+        self._staple: Optional[CertStatus] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    def current(self) -> Optional[CertStatus]:
+        staple = self._staple
+        if staple is None or staple.next_update <= time.time():
+            return None
+        return staple
+
+    def _due(self) -> bool:
+        staple = self._staple
+        if staple is None:
+            return True
+        half_life = (staple.next_update - staple.this_update) / 2
+        return time.time() >= staple.this_update + half_life
+
+    def refresh(self) -> bool:
+        try:
+            fingerprint = key_fingerprint(cert_store.get().public_keys)
+        except FileNotFoundError:
+            return False
+        try:
+            rs = upstream(ca_url()).get(f"/status/{fingerprint}")
+            rs.raise_for_status()
+            self._staple = CertStatus.model_validate_json(rs.content)
+        except (requests.exceptions.RequestException, pydantic.ValidationError) as e:
+            logger.warning("Статус собственного сертификата не обновлён: %s", e)
+            return False
+        if self._staple.status != "good":
+            logger.warning("УЦ сообщает статус ключа: %s", self._staple.status)
+        return True
+
+    def invalidate(self) -> None:
+        """Ключ сменился — старый ответ не прикладываем, новый берём сразу."""
+        self._staple = None
+        self._wake.set()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            if self._due():
+                self.refresh()
+            self._wake.wait(STAPLE_CHECK_INTERVAL)
+            self._wake.clear()
+
+    def start(self) -> None:
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def stats(self) -> dict:
+        staple = self._staple
+        return {"staple": staple.model_dump() if staple is not None else None}
+
+
+stapler = Stapler()
@@ -0,0 +1,80 @@
+import json
+import os
+import threading
+from typing import Optional, Tuple
+
+from usecases.dtos import CertBundle, Certificate
+from usecases.metrics import CERT_STORE_IO_SECONDS
+from usecases.tracing import span
+
+CERTS_DIR = "certs"
+ROOT_CERT_FILE = "root_cert.json"
+ICA_CERT_FILE = "ica_cert.json"
+CLIENT_CERT_FILE = "client_cert.json"
+
+_stat_timer = CERT_STORE_IO_SECONDS.labels("stat")
+_load_timer = CERT_STORE_IO_SECONDS.labels("load")
+
+
+class CertStore:
+    """Сертификаты и ключи клиента, разобранные один раз и кэшированные.
+
+    Файлы перечитываются, только если store сброшен через invalidate()
+    или изменилось mtime одного из них. mtime и разобранный набор хранятся
+    одним кортежем: читатель без блокировки берёт их одним обращением
+    к атрибуту и не может получить старый набор с новыми mtime.
+    """
+
+    def __init__(self, directory: str = CERTS_DIR):
+        self.directory = directory
+        self._cached: Optional[Tuple[Tuple[int, int, int], CertBundle]] = None
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def _paths(self) -> Tuple[str, str, str]:
+        return (
+            os.path.join(self.directory, ROOT_CERT_FILE),
+            os.path.join(self.directory, ICA_CERT_FILE),
+            os.path.join(self.directory, CLIENT_CERT_FILE),
+        )
+
+    def _current_mtimes(self) -> Tuple[int, int, int]:
+        with _stat_timer.time(), span("file_io", op="stat"):
+            root, ica, client = (os.stat(path).st_mtime_ns for path in self._paths())
+        return root, ica, client
+
+    def _load(self) -> CertBundle:
+        root_path, ica_path, client_path = self._paths()
+        with open(root_path, "r") as f:
+            root_ca = Certificate(**json.load(f))
+        with open(ica_path, "r") as f:
+            ica_ca = Certificate(**json.load(f))
+        with open(client_path, "r") as f:
+            data = json.load(f)
+        return CertBundle(
+            root_ca=root_ca,
+            ica_ca=ica_ca,
+            certificate=Certificate(**data["certificate"]),
+            public_keys=data["public_key"],
+            private_key=data["private_key"],
+        )
+
+    def get(self) -> CertBundle:
+        mtimes = self._current_mtimes()
+        cached = self._cached
+        if cached is not None and cached[0] == mtimes:
+            return cached[1]
+        with self._lock:
+            cached = self._cached
+            if cached is None or cached[0] != mtimes:
+                with _load_timer.time(), span("file_io", op="load"):
+                    cached = self._cached = (mtimes, self._load())
+                self.loads += 1
+            return cached[1]
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._cached = None
+
+
+cert_store = CertStore()
@@ -0,0 +1,177 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import requests
+
+from usecases.http_client import upstream
+
+logger = logging.getLogger(__name__)
+
+# Адрес реестра сервисов (api), например http://api:8000.
+# Без него адреса строятся по именам сервисов docker-compose, как раньше.
+REGISTRY_URL = os.getenv("REGISTRY_URL")
+# Сколько секунд ответ реестра считается актуальным
+DISCOVERY_TTL = float(os.getenv("DISCOVERY_TTL", "30"))
+HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", "10"))
+# Имя клиента в реестре (client1, ...) и адрес, по которому он доступен
+CLIENT_ID = os.getenv(
+    "CLIENT_ID", (os.getenv("CLIENT_NAME") or "").strip("'\"").lower()
+)
+CLIENT_HOST = os.getenv("CLIENT_HOST", CLIENT_ID)
+CLIENT_PORT = int(os.getenv("CLIENT_PORT", "8000"))
+CA_PORT = 8001
+
+Peer = Union[int, str]
+
+
+def peer_name(peer: Peer) -> str:
+    """Имя клиента в реестре: номер N превращается в clientN."""
+    peer = str(peer)
+    return f"client{peer}" if peer.isdigit() else peer
+
+
+class Resolver:
+    """Кэш ответов реестра с TTL.
+
+    Пока запись свежая, адрес берётся из памяти без запроса к реестру.
+    Если реестр недоступен, используется устаревшая запись, а при её
+    отсутствии — адрес по умолчанию; ошибка реестра не ломает отправку.
+    """
+
+    def __init__(self, ttl: float = DISCOVERY_TTL):
+        self.ttl = ttl
+        self._cache: Dict[str, Tuple[float, object]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, key: str, fetch: Callable[[], object], fallback: object):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] > now:
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        if not REGISTRY_URL:
+            return fallback
+        try:
+            value = fetch()
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            logger.warning("Реестр недоступен (%s): %s", key, e)
+            return cached[1] if cached is not None else fallback
+        if value is None:
+            # Сервис ещё не зарегистрирован — не запоминаем, он может
+            # появиться в реестре через мгновение
+            return fallback
+        with self._lock:
+            self._cache[key] = (now + self.ttl, value)
+        return value
+
+    def url(self, name: str, default_port: int) -> str:
+        def fetch() -> Optional[str]:
+            rs = upstream(REGISTRY_URL).get(f"/register/resolve/{name}")
+            if rs.status_code == 404:
+                return None
+            rs.raise_for_status()
+            entry = rs.json()
+            return f"http://{entry['host']}:{entry['port']}"
+
+        return self._cached(name, fetch, f"http://{name}:{default_port}")
+
+    def peers(self, default: List[Peer]) -> List[Peer]:
+        def fetch() -> List[str]:
+            rs = upstream(REGISTRY_URL).get("/register/clients")
+            rs.raise_for_status()
+            return [
+                entry["name"] for entry in rs.json() if entry["name"] != CLIENT_ID
+            ]
+
+        return self._cached("/clients", fetch, default)
+
+    def cas(self, default: List[str]) -> List[str]:
+        def fetch() -> Optional[List[str]]:
+            rs = upstream(REGISTRY_URL).get("/register/data_centers")
+            rs.raise_for_status()
+            # Пока ни один УЦ не зарегистрировался — список по умолчанию
+            return [entry["name"] for entry in rs.json()] or None
+
+        return self._cached("/data_centers", fetch, default)
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        with self._lock:
+            if name is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(name, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "registry": REGISTRY_URL,
+                "size": len(self._cache),
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+resolver = Resolver()
+
+
+def client_url(peer: Peer) -> str:
+    return resolver.url(peer_name(peer), CLIENT_PORT)
+
+
+def ca_url(ca: Optional[str] = None) -> str:
+    return resolver.url(ca or os.getenv("MY_CA"), CA_PORT)
+
+
+def register_self() -> bool:
+    if not REGISTRY_URL or not CLIENT_ID:
+        return False
+    try:
+        rs = upstream(REGISTRY_URL).post(
+            "/register/client",
+            json={
+                "name": CLIENT_ID,
+                "host": CLIENT_HOST,
+                "port": CLIENT_PORT,
+                "ca": os.getenv("MY_CA"),
+            },
+        )
+        rs.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.warning("Не удалось зарегистрироваться в реестре: %s", e)
+        return False
+    logger.info("Клиент %s зарегистрирован в реестре %s", CLIENT_ID, REGISTRY_URL)
+    return True
+
+
+_heartbeat_stop = threading.Event()
+
+
+def _heartbeat_loop() -> None:
+    registered = register_self()
+    while not _heartbeat_stop.wait(HEARTBEAT_INTERVAL):
+        if not registered:
+            registered = register_self()
+            continue
+        try:
+            rs = upstream(REGISTRY_URL).post(f"/register/heartbeat/{CLIENT_ID}")
+            # Реестр мог потерять запись — регистрируемся заново
+            registered = rs.status_code != 404
+        except requests.exceptions.RequestException as e:
+            logger.warning("Heartbeat в реестр не отправлен: %s", e)
+
+
+def start_heartbeat() -> None:
+    if REGISTRY_URL:
+        threading.Thread(target=_heartbeat_loop, daemon=True).start()
+
+
+def stop_heartbeat() -> None:
+    _heartbeat_stop.set()
@@ -1,3 +1,6 @@
+import hashlib
+from typing import Optional
+
 import pydantic
 
 
@@ -13,6 +16,27 @@ class Certificate(pydantic.BaseModel):
     timestamp: int
     signature: Signature
 
+    def fingerprint(self) -> str:
+        return hashlib.sha256(self.model_dump_json().encode()).hexdigest()
+
+
+class CertStatus(pydantic.BaseModel):
+    """Подписанный ответ УЦ о статусе ключа клиента (/status/{fingerprint})."""
+
+    ca: str
+    fingerprint: str
+    status: str
+    serial: Optional[int] = None
+    revoked_at: Optional[int] = None
+    this_update: int
+    next_update: int
+    signature: Signature
+
+
+# Сертификаты цепочки в сообщении: каждый передаётся целиком или ссылкой
+# (<поле>_ref — отпечаток сертификата, уже известного получателю)
+CHAIN_FIELDS = ("certificate", "root_ca", "ca_ca")
+
 
 class IncomingMessage(pydantic.BaseModel):
     subject: str
@@ -21,6 +45,35 @@ class IncomingMessage(pydantic.BaseModel):
     timestamp: int
     public_keys: list[int]
     signature: Signature
-    certificate: Certificate
+    certificate: Optional[Certificate] = None
+    root_ca: Optional[Certificate] = None
+    ca_ca: Optional[Certificate] = None
+    certificate_ref: Optional[str] = None
+    root_ca_ref: Optional[str] = None
+    ca_ca_ref: Optional[str] = None
+    # Ответ УЦ о статусе ключа отправителя, приложенный самим отправителем
+    staple: Optional[CertStatus] = None
+
+    @pydantic.model_validator(mode="after")
+    def check_chain(self):
+        for name in CHAIN_FIELDS:
+            if getattr(self, name) is None and getattr(self, f"{name}_ref") is None:
+                raise ValueError(f"Нужно передать {name} или {name}_ref")
+        return self
+
+    def by_reference(self) -> "IncomingMessage":
+        update = {}
+        for name in CHAIN_FIELDS:
+            cert = getattr(self, name)
+            if cert is not None:
+                update[name] = None
+                update[f"{name}_ref"] = cert.fingerprint()
+        return self.model_copy(update=update)
+
+
+class CertBundle(pydantic.BaseModel):
     root_ca: Certificate
-    ca_ca: Certificate
+    ica_ca: Certificate
+    certificate: Certificate
+    public_keys: list[int]
+    private_key: int
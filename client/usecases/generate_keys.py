@@ -4,11 +4,19 @@ import os
 from typing import Dict, Any, Tuple
 import logging
 from cert import (
-    custom_hash,
     ClientCertificate,
     IntermediateCertificate,
     RootCertificate,
 )
+from usecases.cert_status import stapler
+from usecases.crypto_utils import custom_hash
+from usecases.cert_store import cert_store
+from usecases.discovery import ca_url as resolve_ca_url
+from usecases.http_client import upstream
+from usecases.known_certs import known_certs
+from usecases.revocation import revocations
+from usecases.tracing import span
+from usecases.verify_cache import verification_cache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,9 +29,9 @@ def generate_keys_usecase() -> Dict[str, Any]:
         if not client_name:
             raise ValueError("Переменная окружения CLIENT_NAME не установлена")
         client_name = client_name.strip("'").strip('"')
-        ca = os.getenv("MY_CA")
         # Шаг 1. Запрос сертификата клиента и ключей
-        external_endpoint = f"http://{ca}:8001/cert"
+        ca_url = resolve_ca_url()
+        external_endpoint = f"{ca_url}/cert"
         logger.info(
             "Запрос сертификата клиента и ключей с: %s, subject: %s",
             external_endpoint,
@@ -31,9 +39,7 @@ def generate_keys_usecase() -> Dict[str, Any]:
         )
 
         # Отправка GET-запроса с параметром subject
-        response = requests.get(
-            external_endpoint, params={"subject": client_name}, timeout=10
-        )
+        response = upstream(ca_url).get("/cert", params={"subject": client_name})
         response.raise_for_status()
 
         data = response.json()
@@ -42,6 +48,8 @@ def generate_keys_usecase() -> Dict[str, Any]:
         # Создание объекта клиентского сертификата
         client_cert = ClientCertificate(data, client_name)
         client_cert.validate()
+        if revocations.is_revoked(data["public_key"]):
+            raise ValueError("Выданный ключ клиента отозван")
 
         # Сохранение сертификата клиента
         save_dir = "certs"
@@ -52,6 +60,10 @@ def generate_keys_usecase() -> Dict[str, Any]:
         with open(client_cert_path, "w") as f:
             json.dump(data, f, indent=4)
         logger.info("Сертификат клиента сохранён в: %s", client_cert_path)
+        cert_store.invalidate()
+        stapler.invalidate()
+        verification_cache.invalidate()
+        known_certs.clear()
 
         # Шаг 2. Загрузка сертификатов ICA и Root
         ica_cert_path = f"{save_dir}/ica_cert.json"
@@ -95,31 +107,34 @@ def generate_keys_usecase() -> Dict[str, Any]:
                 logger.error("Ошибка при проверке подписи: %s", str(e))
                 raise
 
-        # Проверка подписи сертификата клиента с помощью открытого ключа ICA
-        logger.info(
-            "Проверка подписи сертификата клиента с помощью открытого ключа ICA"
-        )
-        client_cert_data = client_cert.client_data_str()
-        if not verify_signature(
-            client_cert_data, client_cert.signature, ica_cert.public_key
-        ):
-            raise ValueError("Подпись сертификата клиента не верна")
-
-        # Проверка подписи сертификата ICA с помощью открытого ключа Root
-        logger.info("Проверка подписи сертификата ICA с помощью открытого ключа Root")
-        ica_cert_data = ica_cert.to_data_str()
-        if not verify_signature(
-            ica_cert_data, ica_cert.signature, root_cert.public_key
-        ):
-            raise ValueError("Подпись сертификата ICA не верна")
-
-        # Проверка самоподписанного сертификата Root
-        logger.info("Проверка самоподписанного сертификата Root")
-        root_cert_data = root_cert.to_data_str()
-        if not verify_signature(
-            root_cert_data, root_cert.signature, root_cert.public_key
-        ):
-            raise ValueError("Подпись сертификата Root не верна")
+        with span("verify_chain"):
+            # Проверка подписи сертификата клиента с помощью открытого ключа ICA
+            logger.info(
+                "Проверка подписи сертификата клиента с помощью открытого ключа ICA"
+            )
+            client_cert_data = client_cert.client_data_str()
+            if not verify_signature(
+                client_cert_data, client_cert.signature, ica_cert.public_key
+            ):
+                raise ValueError("Подпись сертификата клиента не верна")
+
+            # Проверка подписи сертификата ICA с помощью открытого ключа Root
+            logger.info(
+                "Проверка подписи сертификата ICA с помощью открытого ключа Root"
+            )
+            ica_cert_data = ica_cert.to_data_str()
+            if not verify_signature(
+                ica_cert_data, ica_cert.signature, root_cert.public_key
+            ):
+                raise ValueError("Подпись сертификата ICA не верна")
+
+            # Проверка самоподписанного сертификата Root
+            logger.info("Проверка самоподписанного сертификата Root")
+            root_cert_data = root_cert.to_data_str()
+            if not verify_signature(
+                root_cert_data, root_cert.signature, root_cert.public_key
+            ):
+                raise ValueError("Подпись сертификата Root не верна")
 
         logger.info("Проверка цепочки сертификатов успешно завершена")
 
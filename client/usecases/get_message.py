@@ -1,37 +1,30 @@
-import json
+from typing import Optional, Tuple
 from fastapi import HTTPException, Request
 from fastapi.responses import JSONResponse
 import pydantic
+from usecases.cert_status import GOOD, REVOKED, STATUS_REQUIRED, status_cache
 from usecases.crypto_utils import construct_data_str, custom_hash, check_signature
 
-from usecases.dtos import Certificate, IncomingMessage
+from usecases.dtos import CertBundle, Certificate, IncomingMessage
+from usecases.known_certs import known_certs
+from usecases.revocation import revocations
+from usecases.tracing import span
+from usecases.verify_cache import verification_cache
 
 
-def get_message_usecase(request: Request, message: IncomingMessage):
-    msg = message.message
-    request.app.state.recv_msg = msg
-    with open("certs/root_cert.json", "r") as f:
-        root_ca = Certificate(**json.load(f))
-    with open("certs/ica_cert.json", "r") as f:
-        ica_ca = Certificate(**json.load(f))
-    with open("certs/client_cert.json") as f:
-        data = json.load(f)
-        public_keys = data["public_key"]
-        private_key = data["private_key"]
-        my_cert = data["certificate"]
-        my_ca = Certificate(**my_cert)
+# Проверяет подпись сообщения и цепочку сертификатов.
+# Возвращает (HTTP-статус, текст проверки); состояние приложения не трогает,
+# поэтому может выполняться в отдельном процессе.
+def verify_message(message: IncomingMessage, root_ca: Certificate) -> Tuple[int, str]:
     if not check_signature(
         message.signature,
-        construct_data_str(msg, message.public_keys, message.timestamp),
+        construct_data_str(message.message, message.public_keys, message.timestamp),
         message.public_keys[0],
         message.public_keys[1],
     ):
-        request.app.state.recv_check = "Подпись сообщения не верна"
-        return JSONResponse(
-            {"message": msg, "check": "Подпись сообщения не верна"}, 400
-        )
+        return 400, "Подпись сообщения не верна"
 
-    if not check_signature(
+    if not verification_cache.check(
         message.certificate.signature,
         construct_data_str(
             message.certificate.subject,
@@ -41,7 +34,7 @@ def get_message_usecase(request: Request, message: IncomingMessage):
         message.certificate.public_key[0],
         message.certificate.public_key[1],
     ):  # Поменять проверку по ключу из наших сертов
-        if not check_signature(
+        if not verification_cache.check(
             message.ca_ca.signature,
             construct_data_str(
                 message.ca_ca.subject, message.ca_ca.public_key, message.ca_ca.timestamp
@@ -49,11 +42,8 @@ def get_message_usecase(request: Request, message: IncomingMessage):
             root_ca.public_key[0],
             root_ca.public_key[1],
         ):  # same
-            request.app.state.recv_check = "Подпись сертификата УЦ не верна"
-            return JSONResponse(
-                {"message": msg, "check": "Подпись сертификата УЦ не верна"}, 400
-            )
-        if not check_signature(
+            return 400, "Подпись сертификата УЦ не верна"
+        if not verification_cache.check(
             message.root_ca.signature,
             construct_data_str(
                 message.root_ca.subject,
@@ -63,11 +53,80 @@ def get_message_usecase(request: Request, message: IncomingMessage):
             root_ca.public_key[0],
             root_ca.public_key[1],
         ):  # same
-            request.app.state.recv_check = "Подпись сертификата корневого УЦ не верна"
-            return JSONResponse(
-                {"message": msg, "check": "Подпись сертификата корневого УЦ не верна"},
-                400,
-            )
-
-    request.app.state.recv_check = "Подпись верна"
-    return JSONResponse({"message": msg, "check": "Подпись верна"})
+            return 400, "Подпись сертификата корневого УЦ не верна"
+
+    return 200, "Подпись верна"
+
+
+def is_revoked(message: IncomingMessage) -> bool:
+    # Список отзыва — без запросов к УЦ и до проверки подписи
+    return revocations.is_revoked(message.public_keys)
+
+
+def trusted_issuer(
+    message: IncomingMessage, certs: CertBundle
+) -> Optional[Certificate]:
+    """Сертификат УЦ отправителя, если он наш или подписан нашим корневым."""
+    ca_ca = message.ca_ca
+    if ca_ca is None:
+        return None
+    if ca_ca.public_key == certs.ica_ca.public_key:
+        return certs.ica_ca
+    root_e, root_n = certs.root_ca.public_key
+    if verification_cache.check(
+        ca_ca.signature,
+        construct_data_str(ca_ca.subject, ca_ca.public_key, ca_ca.timestamp),
+        root_e,
+        root_n,
+    ):
+        return ca_ca
+    return None
+
+
+UNKNOWN_CERT_STATUS = 409
+UNKNOWN_CERT_CHECK = "Неизвестный сертификат, пришлите полную цепочку"
+REVOKED_STATUS = 403
+REVOKED_CHECK = "Сертификат отправителя отозван"
+NO_STATUS_CHECK = "Нет действительного ответа УЦ о статусе сертификата"
+
+
+def status_rejected(
+    message: IncomingMessage, certs: CertBundle
+) -> Optional[Tuple[int, str]]:
+    """Отказ по ответу УЦ о статусе ключа отправителя или None.
+
+    Приложенный отправителем ответ смотрим только после verify_message:
+    иначе чужое сообщение с ключом жертвы отравило бы кэш статусов.
+    С STATUS_REQUIRED принимается только статус "good".
+    """
+    issuer = trusted_issuer(message, certs)
+    status = status_cache.check(message, issuer) if issuer is not None else None
+    if status == REVOKED:
+        return REVOKED_STATUS, REVOKED_CHECK
+    if STATUS_REQUIRED and status != GOOD:
+        return REVOKED_STATUS, NO_STATUS_CHECK
+    return None
+
+
+def get_message_usecase(request: Request, message: IncomingMessage, certs: CertBundle):
+    msg = message.message
+    message, unknown = known_certs.resolve(message)
+    if unknown:
+        # Отправитель пришлёт то же сообщение с полной цепочкой
+        return JSONResponse(
+            {"message": msg, "check": UNKNOWN_CERT_CHECK, "unknown_certs": unknown},
+            UNKNOWN_CERT_STATUS,
+        )
+    request.app.state.recv_msg = msg
+    # Ключ отправителя проверяется до подписи: отозванный отсеивается сразу
+    if is_revoked(message):
+        status, check = REVOKED_STATUS, REVOKED_CHECK
+    else:
+        with span("verify"):
+            status, check = verify_message(message, certs.root_ca)
+        if status == 200:
+            status, check = status_rejected(message, certs) or (status, check)
+    if status == 200:
+        known_certs.remember(message)
+    request.app.state.recv_check = check
+    return JSONResponse({"message": msg, "check": check}, status)
@@ -0,0 +1,163 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent import futures
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+from typing import List, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+
+from usecases.dtos import CertBundle, IncomingMessage
+from usecases.get_message import (
+    REVOKED_CHECK,
+    REVOKED_STATUS,
+    UNKNOWN_CERT_CHECK,
+    UNKNOWN_CERT_STATUS,
+    is_revoked,
+    status_rejected,
+    verify_message,
+)
+from usecases.known_certs import known_certs
+from usecases.metrics import observe_pool
+from usecases.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Число процессов для параллельной проверки пакета (0 — проверять в запросе)
+BATCH_VERIFY_WORKERS = int(
+    os.getenv("BATCH_VERIFY_WORKERS", str(os.cpu_count() or 1))
+)
+# Пакеты меньше этого размера проверяются без пула процессов
+BATCH_PARALLEL_THRESHOLD = int(os.getenv("BATCH_PARALLEL_THRESHOLD", "8"))
+# Сколько секунд пакет может проверяться в пуле процессов
+BATCH_VERIFY_TIMEOUT = float(os.getenv("BATCH_VERIFY_TIMEOUT", "30"))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+# Сообщения, отданные пулу процессов и ещё не проверенные
+_in_flight = 0
+observe_pool("batch_verify", lambda: _in_flight, BATCH_VERIFY_WORKERS)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Не fork: к моменту запуска процессов блокировки кэшей, потоков
+            # синхронизации и логирования могут быть заняты, и ребёнок
+            # унаследует их навсегда. forkserver порождает процессы из
+            # отдельного чистого процесса
+            _executor = ProcessPoolExecutor(
+                max_workers=BATCH_VERIFY_WORKERS,
+                mp_context=multiprocessing.get_context("forkserver"),
+            )
+        return _executor
+
+
+def start_executor() -> None:
+    if BATCH_VERIFY_WORKERS > 0:
+        # Процессы поднимаются сейчас, а не на первом пакете
+        _get_executor().submit(int)
+
+
+def _discard_executor(executor: ProcessPoolExecutor) -> None:
+    # Зависший или сломанный пул заменяется новым при следующем пакете
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _track(count: int) -> None:
+    global _in_flight
+    with _executor_lock:
+        _in_flight += count
+
+
+def shutdown_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def get_messages_usecase(
+    request: Request, messages: List[IncomingMessage], certs: CertBundle
+):
+    if not messages:
+        return JSONResponse([])
+
+    # Ссылки на сертификаты и отзыв проверяются здесь: кэш известных
+    # сертификатов и список отзыва есть только в этом процессе
+    verdicts: List[dict] = []
+    resolved: List[IncomingMessage] = []
+    for message in messages:
+        message, unknown = known_certs.resolve(message)
+        if unknown:
+            verdicts.append(
+                {
+                    "message": message.message,
+                    "check": UNKNOWN_CERT_CHECK,
+                    "status": UNKNOWN_CERT_STATUS,
+                    "unknown_certs": unknown,
+                }
+            )
+        elif is_revoked(message):
+            verdicts.append(
+                {
+                    "message": message.message,
+                    "check": REVOKED_CHECK,
+                    "status": REVOKED_STATUS,
+                }
+            )
+        else:
+            verdicts.append({"message": message.message})
+            resolved.append(message)
+
+    if BATCH_VERIFY_WORKERS > 0 and len(resolved) >= BATCH_PARALLEL_THRESHOLD:
+        chunksize = max(1, len(resolved) // (BATCH_VERIFY_WORKERS * 4))
+        executor = _get_executor()
+        _track(len(resolved))
+        try:
+            results = list(
+                executor.map(
+                    verify_message,
+                    resolved,
+                    repeat(certs.root_ca),
+                    chunksize=chunksize,
+                    timeout=BATCH_VERIFY_TIMEOUT,
+                )
+            )
+        except (futures.TimeoutError, BrokenProcessPool) as e:
+            logger.error("Пул проверки пакетов не ответил: %r", e)
+            _discard_executor(executor)
+            raise HTTPException(
+                status_code=503, detail="Проверка пакета не завершилась, повторите"
+            )
+        finally:
+            _track(-len(resolved))
+    else:
+        with span("verify", messages=len(resolved)):
+            results = [verify_message(message, certs.root_ca) for message in resolved]
+
+    pending = iter(zip(resolved, results))
+    for verdict in verdicts:
+        if "status" in verdict:
+            continue
+        message, (status, check) = next(pending)
+        if status == 200:
+            status, check = status_rejected(message, certs) or (status, check)
+        verdict.update({"check": check, "status": status})
+        if status == 200:
+            known_certs.remember(message)
+
+    # Состояние для UI обновляется один раз на пакет — последним сообщением
+    request.app.state.recv_msg = verdicts[-1]["message"]
+    request.app.state.recv_check = verdicts[-1]["check"]
+    return JSONResponse(verdicts)
@@ -0,0 +1,64 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from usecases.dtos import CHAIN_FIELDS, Certificate, IncomingMessage
+
+KNOWN_CERTS_SIZE = int(os.getenv("KNOWN_CERTS_SIZE", "1024"))
+
+
+class KnownCerts:
+    """Сертификаты из сообщений, прошедших проверку, по их отпечаткам.
+
+    Позволяет отправителю передавать цепочку ссылками (<поле>_ref).
+    """
+
+    def __init__(self, maxsize: int = KNOWN_CERTS_SIZE):
+        self.maxsize = maxsize
+        self._certs: "OrderedDict[str, Certificate]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, fingerprint: str) -> Optional[Certificate]:
+        with self._lock:
+            cert = self._certs.get(fingerprint)
+            if cert is not None:
+                self._certs.move_to_end(fingerprint)
+            return cert
+
+    def remember(self, message: IncomingMessage) -> None:
+        certs = [getattr(message, name) for name in CHAIN_FIELDS]
+        with self._lock:
+            for cert in certs:
+                fingerprint = cert.fingerprint()
+                self._certs[fingerprint] = cert
+                self._certs.move_to_end(fingerprint)
+            while len(self._certs) > self.maxsize:
+                self._certs.popitem(last=False)
+
+    def resolve(self, message: IncomingMessage) -> Tuple[IncomingMessage, List[str]]:
+        """Подставляет сертификаты вместо ссылок.
+
+        Возвращает сообщение с полной цепочкой и список неизвестных отпечатков.
+        """
+        update = {}
+        unknown = []
+        for name in CHAIN_FIELDS:
+            if getattr(message, name) is not None:
+                continue
+            fingerprint = getattr(message, f"{name}_ref")
+            cert = self.get(fingerprint)
+            if cert is None:
+                unknown.append(fingerprint)
+            else:
+                update[name] = cert
+        if update:
+            message = message.model_copy(update=update)
+        return message, unknown
+
+    def clear(self) -> None:
+        with self._lock:
+            self._certs.clear()
+
+
+known_certs = KnownCerts()
@@ -0,0 +1,234 @@
+import hashlib
+import logging
+import math
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from sys import byteorder
+from typing import Dict, Iterable, List
+
+import requests
+
+from usecases.discovery import ca_url, resolver
+from usecases.http_client import upstream
+
+logger = logging.getLogger(__name__)
+
+# УЦ, чьи списки отзыва загружаются, если реестр не задан или пуст
+REVOCATION_CAS = [ca for ca in os.getenv("REVOCATION_CAS", "ca1,ca2").split(",") if ca]
+CRL_REFRESH_INTERVAL = float(os.getenv("CRL_REFRESH_INTERVAL", "10"))
+# Ожидаемое число отзывов и доля ложных срабатываний фильтра Блума;
+# при переполнении фильтр перестраивается вдвое большим
+CRL_CAPACITY = int(os.getenv("CRL_CAPACITY", "100000"))
+CRL_ERROR_RATE = float(os.getenv("CRL_ERROR_RATE", "0.01"))
+# Сколько новых отзывов копится в множестве до слияния с массивом
+CRL_MERGE_THRESHOLD = int(os.getenv("CRL_MERGE_THRESHOLD", "4096"))
+
+
+def key_fingerprint(public_key: List[int]) -> str:
+    """Отпечаток открытого ключа клиента, как в журнале УЦ."""
+    e, n = public_key
+    return hashlib.sha256(f"{e}|{n}".encode()).hexdigest()
+
+
+def fingerprint_prefix(fingerprint: str) -> int:
+    return int(fingerprint[:16], 16)
+
+
+class RevocationSet:
+    """Отозванные ключи всех УЦ для проверки входящих сообщений.
+
+    Ключ — первые 64 бита отпечатка. Проверка начинается с фильтра Блума
+    (k обращений к bytearray), и неотозванный ключ почти всегда отсеивается
+    на нём. Точный ответ дают отсортированный array("Q") — 8 байт на
+    отзыв — и небольшое множество отзывов из последних дельт, которое
+    периодически сливается с массивом. Читатели работают без блокировки:
+    писатель только добавляет биты и подменяет массив и множество целиком.
+    """
+
+    def __init__(
+        self,
+        capacity: int = CRL_CAPACITY,
+        error_rate: float = CRL_ERROR_RATE,
+        merge_threshold: int = CRL_MERGE_THRESHOLD,
+    ):
+        self.error_rate = error_rate
+        self.merge_threshold = merge_threshold
+        self.versions: Dict[str, int] = {}
+        self.false_positives = 0
+        self._sorted = array("Q")
+        self._recent: set = set()
+        self._lock = threading.Lock()
+        self._resize(capacity)
+
+    def __len__(self) -> int:
+        return len(self._sorted) + len(self._recent)
+
+    def _resize(self, capacity: int, *sources: Iterable[int]) -> None:
+        """Строит фильтр заново; sources — все префиксы, которые в нём нужны."""
+        bits_per_entry = -math.log(self.error_rate) / math.log(2) ** 2
+        size = max(64, math.ceil(capacity * bits_per_entry))
+        bloom = bytearray((size + 7) // 8)
+        hashes = max(1, round(size / capacity * math.log(2)))
+        for source in sources:
+            for prefix in source:
+                self._set_bits(bloom, size, hashes, prefix)
+        self.capacity = capacity
+        # Одним присваиванием: читатель не увидит фильтр с чужими параметрами
+        self._bloom = (bloom, size, hashes)
+
+    @staticmethod
+    def _set_bits(bloom: bytearray, size: int, hashes: int, prefix: int) -> None:
+        # Двойное хэширование: половины префикса отпечатка уже равномерны
+        h1, h2 = prefix & 0xFFFFFFFF, (prefix >> 32) | 1
+        for i in range(hashes):
+            position = (h1 + i * h2) % size
+            bloom[position >> 3] |= 1 << (position & 7)
+
+    def add(self, prefixes: Iterable[int]) -> int:
+        """Добавляет префиксы отпечатков; возвращает число новых."""
+        added = 0
+        with self._lock:
+            for prefix in prefixes:
+                if self._contains(prefix):
+                    continue
+                self._recent.add(prefix)
+                bloom, size, hashes = self._bloom
+                self._set_bits(bloom, size, hashes, prefix)
+                added += 1
+            if len(self._recent) > self.merge_threshold:
+                self._merge()
+            if len(self) > self.capacity:
+                self._resize(len(self) * 2, self._sorted, self._recent)
+        return added
+
+    def load(self, prefixes: array) -> int:
+        """Объединяет снимок списка отзыва с уже известными отзывами."""
+        with self._lock:
+            before = len(self)
+            merged = set(prefixes)
+            merged.update(self._sorted)
+            merged.update(self._recent)
+            values = array("Q", sorted(merged))
+            # Фильтр — до подмены массива, иначе читатель пропустит отзыв
+            self._resize(max(self.capacity, len(values) * 2), values)
+            self._sorted = values
+            self._recent = set()
+            return len(self) - before
+
+    def _merge(self) -> None:
+        merged = self._sorted.tolist()
+        merged.extend(self._recent)
+        merged.sort()
+        # Сначала массив, потом множество: отзыв всегда виден хотя бы в одном
+        self._sorted = array("Q", merged)
+        self._recent = set()
+
+    def _contains(self, prefix: int) -> bool:
+        if prefix in self._recent:
+            return True
+        values = self._sorted
+        index = bisect_left(values, prefix)
+        return index < len(values) and values[index] == prefix
+
+    def is_revoked(self, public_key: List[int]) -> bool:
+        prefix = fingerprint_prefix(key_fingerprint(public_key))
+        bloom, size, hashes = self._bloom
+        h1, h2 = prefix & 0xFFFFFFFF, (prefix >> 32) | 1
+        for i in range(hashes):
+            position = (h1 + i * h2) % size
+            if not bloom[position >> 3] & (1 << (position & 7)):
+                return False
+        if self._contains(prefix):
+            return True
+        self.false_positives += 1
+        return False
+
+    def sync(self, ca: str) -> int:
+        """Догружает список отзыва УЦ: снимок при первой загрузке, далее дельты."""
+        client = upstream(ca_url(ca))
+        version = self.versions.get(ca, 0)
+        if version == 0:
+            rs = client.get("/crl/snapshot")
+            rs.raise_for_status()
+            prefixes = array("Q")
+            prefixes.frombytes(rs.content)
+            if byteorder == "little":
+                prefixes.byteswap()
+            added = self.load(prefixes)
+            self.versions[ca] = int(rs.headers["X-CRL-Version"])
+            return added
+        added = 0
+        while True:
+            rs = client.get("/crl", params={"since": version})
+            rs.raise_for_status()
+            data = rs.json()
+            if data["version"] < version:
+                # Список УЦ начат заново — берём снимок; отзывы не снимаются
+                self.versions[ca] = 0
+                return added + self.sync(ca)
+            entries = data["entries"]
+            if entries:
+                added += self.add(self._prefixes(ca, entries))
+                version = entries[-1]["seq"]
+                self.versions[ca] = version
+            if not entries or version >= data["version"]:
+                return added
+
+    @staticmethod
+    def _prefixes(ca: str, entries: List[dict]) -> List[int]:
+        # Испорченная запись не должна останавливать синхронизацию:
+        # иначе версия не растёт и список этого УЦ не обновится никогда
+        prefixes = []
+        for entry in entries:
+            try:
+                prefixes.append(fingerprint_prefix(entry["fingerprint"]))
+            except (KeyError, TypeError, ValueError):
+                logger.warning("Пропущена испорченная запись отзыва %s: %r", ca, entry)
+        return prefixes
+
+    def sync_all(self) -> None:
+        for ca in resolver.cas(REVOCATION_CAS):
+            try:
+                added = self.sync(ca)
+            except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                logger.warning("Список отзыва %s не обновлён: %s", ca, e)
+                continue
+            if added:
+                logger.info(
+                    "Список отзыва %s: +%d, версия %d", ca, added, self.versions[ca]
+                )
+
+    def stats(self) -> dict:
+        bloom, size, hashes = self._bloom
+        return {
+            "revoked": len(self),
+            "versions": dict(self.versions),
+            "capacity": self.capacity,
+            "bloom_bytes": len(bloom),
+            "bloom_hashes": hashes,
+            "sorted_bytes": len(self._sorted) * self._sorted.itemsize,
+            "pending_merge": len(self._recent),
+            "false_positives": self.false_positives,
+        }
+
+
+revocations = RevocationSet()
+
+_sync_stop = threading.Event()
+
+
+def _sync_loop() -> None:
+    while True:
+        revocations.sync_all()
+        if _sync_stop.wait(CRL_REFRESH_INTERVAL):
+            return
+
+
+def start_sync() -> None:
+    threading.Thread(target=_sync_loop, daemon=True).start()
+
+
+def stop_sync() -> None:
+    _sync_stop.set()
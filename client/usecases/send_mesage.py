@@ -1,30 +1,113 @@
 import json
 import os
+import threading
 import time
 from typing import Optional
+from fastapi import HTTPException
 from fastapi.responses import JSONResponse
 import requests
 
+from usecases.cert_status import stapler
 from usecases.crypto_utils import custom_hash, construct_data_str
-from usecases.dtos import Certificate, IncomingMessage, Signature
+from usecases.dtos import CertBundle, IncomingMessage, Signature
+from usecases.discovery import REGISTRY_URL, Peer, client_url, peer_name
+from usecases.http_client import upstream
 
 
-def send_message_usecase(
-    client_id: int,
+# Отправлять цепочку ссылками тем, кто её уже принял
+CERT_BY_REFERENCE = os.getenv("CERT_BY_REFERENCE", "1") == "1"
+UNKNOWN_CERT_STATUS = 409
+JSON_HEADERS = {"Content-Type": "application/json"}
+# Ретранслятор api (store-and-forward): сообщение сохраняется в api и
+# доставляется получателю в фоне, с повторами, даже если он сейчас недоступен.
+# По умолчанию — тот же api, что и реестр
+RELAY_URL = os.getenv("RELAY_URL") or REGISTRY_URL
+# Отправлять через ретранслятор, если в запросе не указано иное
+SEND_VIA_RELAY = os.getenv("SEND_VIA_RELAY", "0") == "1"
+
+# Получатели, которые уже приняли нашу полную цепочку
+peers_with_chain: set = set()
+peers_lock = threading.Lock()
+
+
+def is_unknown_cert(rs: requests.Response) -> bool:
+    # 409 отвечает и получатель, у которого ещё нет своих сертификатов;
+    # просьба прислать полную цепочку отличается полем unknown_certs
+    if rs.status_code != UNKNOWN_CERT_STATUS:
+        return False
+    try:
+        body = rs.json()
+    except ValueError:
+        return False
+    return isinstance(body, dict) and "unknown_certs" in body
+
+
+def response_check(rs: requests.Response) -> str:
+    """Итог проверки получателем, а если его нет — текст ошибки ответа."""
+    try:
+        body = rs.json()
+    except ValueError:
+        return f"HTTP {rs.status_code}"
+    if isinstance(body, dict):
+        check = body.get("check") or body.get("detail")
+        if isinstance(check, str) and check:
+            return check
+        if check:
+            return json.dumps(check, ensure_ascii=False)
+    return f"HTTP {rs.status_code}"
+
+
+def deliver_message(
+    client_id: Peer, full_body: str, ref_body: Optional[str] = None
+) -> requests.Response:
+    """POST сообщения получателю: ссылками, если он знает нашу цепочку.
+
+    На ответ 409 с unknown_certs (неизвестный сертификат) сообщение один
+    раз переотправляется с полной цепочкой.
+    """
+    url = client_url(client_id)
+    client = upstream(url)
+    with peers_lock:
+        knows_chain = url in peers_with_chain
+    if CERT_BY_REFERENCE and ref_body is not None and knows_chain:
+        rs = client.post("/message/get_message", data=ref_body, headers=JSON_HEADERS)
+        if not is_unknown_cert(rs):
+            return rs
+        with peers_lock:
+            peers_with_chain.discard(url)
+    rs = client.post("/message/get_message", data=full_body, headers=JSON_HEADERS)
+    if rs.status_code == 200:
+        with peers_lock:
+            peers_with_chain.add(url)
+    return rs
+
+
+def relay_message(client_id: Peer, full_body: str) -> requests.Response:
+    """Сдаёт сообщение ретранслятору; ответ 202 — принято к доставке.
+
+    Получатель не сможет попросить полную цепочку, поэтому она
+    передаётся всегда.
+    """
+    if not RELAY_URL:
+        raise HTTPException(
+            status_code=400, detail="Ретранслятор не задан: укажите RELAY_URL"
+        )
+    recipient = json.dumps(peer_name(client_id))
+    return upstream(RELAY_URL).post(
+        "/message/proccess_message",
+        data=f'{{"recipient": {recipient}, "payload": {full_body}}}',
+        headers=JSON_HEADERS,
+    )
+
+
+def build_message(
     message: str,
+    certs: CertBundle,
     override_r: Optional[int] = None,
     override_s: Optional[int] = None,
-):
-    with open("certs/root_cert.json", "r") as f:
-        root_ca = Certificate(**json.load(f))
-    with open("certs/ica_cert.json", "r") as f:
-        ica_ca = Certificate(**json.load(f))
-    with open("certs/client_cert.json") as f:
-        data = json.load(f)
-        public_keys = data["public_key"]
-        private_key = data["private_key"]
-        cert = data["certificate"]
-        my_ca = Certificate(**cert)
+) -> IncomingMessage:
+    public_keys = certs.public_keys
+    private_key = certs.private_key
     stamp = int(time.time())
     data_str = construct_data_str(message, public_keys, stamp)
     r = custom_hash(data_str, public_keys[1])
@@ -35,24 +118,48 @@ def send_message_usecase(
         s = override_s
     sign = Signature(r=r, s=s)
 
-    msg = IncomingMessage(
+    return IncomingMessage(
         subject=os.getenv("CLIENT_NAME"),
         message=message,
         signature=sign,
         timestamp=stamp,
         public_keys=public_keys,
-        certificate=my_ca,
-        root_ca=root_ca,
-        ca_ca=ica_ca,
+        certificate=certs.certificate,
+        root_ca=certs.root_ca,
+        ca_ca=certs.ica_ca,
+        # Получателю не придётся спрашивать наш УЦ о статусе ключа
+        staple=stapler.current(),
     )
-    rs = requests.post(
-        url=f"http://client{str(client_id)}:8000/message/get_message",
-        json=msg.model_dump(),
+
+
+def send_message_usecase(
+    client_id: int,
+    message: str,
+    certs: CertBundle,
+    override_r: Optional[int] = None,
+    override_s: Optional[int] = None,
+    via_relay: bool = SEND_VIA_RELAY,
+):
+    msg = build_message(message, certs, override_r, override_s)
+    if via_relay:
+        rs = relay_message(client_id, msg.model_dump_json(exclude_none=True))
+        return JSONResponse(
+            {
+                "message": msg.message,
+                "relay": rs.json(),
+                "signature": msg.signature.model_dump(),
+            },
+            rs.status_code,
+        )
+    rs = deliver_message(
+        client_id,
+        msg.model_dump_json(exclude_none=True),
+        msg.by_reference().model_dump_json(exclude_none=True),
     )  # подумать
     return JSONResponse(
         {
             "message": msg.message,
-            "check": rs.json()["check"],
-            "signature": sign.model_dump(),
+            "check": response_check(rs),
+            "signature": msg.signature.model_dump(),
         }
     )
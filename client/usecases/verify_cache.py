@@ -0,0 +1,76 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from usecases.crypto_utils import check_signature
+from usecases.dtos import Signature
+
+VERIFY_CACHE_SIZE = int(os.getenv("VERIFY_CACHE_SIZE", "4096"))
+VERIFY_CACHE_TTL = float(os.getenv("VERIFY_CACHE_TTL", "300"))
+
+# (e, n, data_str, r, s)
+CacheKey = Tuple[int, int, str, int, int]
+
+
+class VerificationCache:
+    """LRU-кэш результатов check_signature для сертификатов цепочки.
+
+    Ключ — открытый ключ издателя, data_str и подпись, поэтому повторная
+    цепочка от того же отправителя проверяется поиском в словаре.
+    """
+
+    def __init__(
+        self, maxsize: int = VERIFY_CACHE_SIZE, ttl: float = VERIFY_CACHE_TTL
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[CacheKey, Tuple[bool, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def check(self, sign: Signature, data_str: str, e: int, n: int) -> bool:
+        key = (e, n, data_str, sign.r, sign.s)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        verdict = check_signature(sign, data_str, e, n)
+        with self._lock:
+            self._entries[key] = (verdict, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return verdict
+
+    def invalidate(self, public_key: Optional[list[int]] = None) -> None:
+        """Сбрасывает весь кэш или только записи издателя с public_key."""
+        with self._lock:
+            if public_key is None:
+                self._entries.clear()
+                return
+            e, n = public_key
+            for key in [k for k in self._entries if k[0] == e and k[1] == n]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+verification_cache = VerificationCache()
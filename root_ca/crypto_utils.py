@@ -1,71 +1,129 @@
+import functools
+import secrets
+import sys
 import time
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from metrics import KEYGEN_SECONDS, SIGN_SECONDS, observe_hash, sampler
+from tracing import span
+
+# Граница решета: нечётные простые меньше этого числа используются
+# для пробного деления и для отсева кандидатов в окне
+SIEVE_LIMIT = 2048
+
+
+def _odd_primes_below(limit: int) -> List[int]:
+    sieve = bytearray([1]) * limit
+    sieve[0:2] = b"\x00\x00"
+    for i in range(2, int(limit**0.5) + 1):
+        if sieve[i]:
+            sieve[i * i :: i] = bytes(len(range(i * i, limit, i)))
+    return [i for i in range(3, limit) if sieve[i]]
+
 
 # Набор малых простых для предварительной проверки
-SMALL_PRIMES = [
-    3,
-    5,
-    7,
-    11,
-    13,
-    17,
-    19,
-    23,
-    29,
-    31,
-    37,
-    41,
-    43,
-    47,
-    53,
-    59,
-    61,
-    67,
-    71,
-    73,
-    79,
-    83,
-    89,
-    97,
-]
-
-# Глобальное зерно для псевдослучайного генератора
-last_seed = int(time.time() * 1000)
-
-
-def custom_random(min_val: int, max_val: int) -> int:
-    global last_seed
-    last_seed = (last_seed + int(time.time() * 1000)) * 25214903917
-    return min_val + abs(last_seed) % (max_val - min_val + 1)
-
-
-# Простой тест Ферма + проверка делимости малыми числами
-def is_prime(n: int, iterations: int = 5) -> bool:
+SMALL_PRIMES = _odd_primes_below(SIEVE_LIMIT)
+
+# Основания, при которых тест Миллера-Рабина детерминирован
+# для всех n < MR_DETERMINISTIC_LIMIT
+MR_DETERMINISTIC_BASES = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41]
+MR_DETERMINISTIC_LIMIT = 3317044064679887385961981
+
+
+def random_bits(bits: int) -> int:
+    return secrets.randbits(bits)
+
+
+# Число раундов Миллера-Рабина для вероятностного режима
+def mr_rounds(bits: int) -> int:
+    if bits >= 1024:
+        return 5
+    if bits >= 512:
+        return 8
+    return 16
+
+
+def miller_rabin(n: int, bases) -> bool:
+    d = n - 1
+    s = 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for a in bases:
+        a %= n
+        if a in (0, 1, n - 1):
+            continue
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+# Проверка делимости малыми числами + тест Миллера-Рабина
+# (детерминированный для n < MR_DETERMINISTIC_LIMIT, иначе вероятностный)
+def is_prime(n: int, iterations: Optional[int] = None) -> bool:
     if n < 2:
         return False
-    if n in SMALL_PRIMES:
+    if n == 2:
         return True
+    if n % 2 == 0:
+        return False
     for p in SMALL_PRIMES:
+        if n == p:
+            return True
         if n % p == 0:
             return False
-    for _ in range(iterations):
-        a = custom_random(2, n - 2)
-        if pow(a, n - 1, n) != 1:
-            return False
-    return True
+    if n < SIEVE_LIMIT * SIEVE_LIMIT:
+        return True
+    if n < MR_DETERMINISTIC_LIMIT:
+        return miller_rabin(n, MR_DETERMINISTIC_BASES)
+    # Дешёвый отсев по основанию 2 перед случайными раундами
+    if not miller_rabin(n, [2]):
+        return False
+    rounds = iterations if iterations is not None else mr_rounds(n.bit_length())
+    return miller_rabin(n, [2 + secrets.randbelow(n - 3) for _ in range(rounds)])
+
+
+# Окно нечётных кандидатов base, base + 2, ..., отсеянных решетом
+def sieve_window(base: int, size: int) -> bytearray:
+    window = bytearray([1]) * size
+    for p in SMALL_PRIMES:
+        # Первый индекс i, для которого base + 2 * i делится на p
+        i = (-base * ((p + 1) // 2)) % p
+        window[i::p] = bytes(len(range(i, size, p)))
+    return window
 
 
 # Генерация случайного простого числа заданной битовой длины
 def generate_prime(bits: int = 64) -> int:
+    if bits < 2:
+        raise ValueError("bits должно быть не меньше 2")
+    if bits == 2:
+        return 2 | random_bits(1)
+    if bits <= 16:
+        # Слишком короткие числа: решето вычеркнуло бы сами малые простые
+        while True:
+            candidate = random_bits(bits) | 1 | (1 << (bits - 1))
+            if is_prime(candidate):
+                return candidate
+    size = max(64, 2 * bits)
     while True:
-        candidate = 0
-        candidate |= (1 << (bits - 1)) | 1
-        for i in range(1, bits - 1):
-            bit = custom_random(0, 1)
-            if bit == 1:
-                candidate |= 1 << i
-        if is_prime(candidate):
-            return candidate
+        base = random_bits(bits) | 1 | (1 << (bits - 1))
+        window = sieve_window(base, size)
+        i = window.find(1)
+        while i != -1:
+            candidate = base + 2 * i
+            if candidate.bit_length() != bits:
+                break
+            if is_prime(candidate):
+                return candidate
+            i = window.find(1, i + 1)
 
 
 # Вычисление НОД
@@ -89,26 +147,98 @@ def modinv(a: int, m: int) -> int:
 
 # Генерация ключей RSA: p, q, n, e, d
 def generate_keys(bits: int = 64) -> Tuple[int, int, int, int, int]:
-    p = generate_prime(bits)
-    q = generate_prime(bits)
-    while p == q:
+    with KEYGEN_SECONDS.labels(bits).time(), span("keygen", bits=bits):
+        p = generate_prime(bits)
         q = generate_prime(bits)
-    n = p * q
-    phi = (p - 1) * (q - 1)
-    e = 65537
-    while gcd(e, phi) != 1:
-        e += 2
-    d = modinv(e, phi)
+        while p == q:
+            q = generate_prime(bits)
+        n = p * q
+        phi = (p - 1) * (q - 1)
+        e = 65537
+        while gcd(e, phi) != 1:
+            e += 2
+        d = modinv(e, phi)
     return p, q, n, e, d
 
 
+# Подпись RSA через китайскую теорему об остатках: вместо pow(r, d, n)
+# два возведения в степень по модулям p и q вдвое меньшей длины.
+# Результат совпадает с pow(r, d, n) для любого 0 <= r < n.
+class CRTSigner:
+    def __init__(self, p: int, q: int, d: int):
+        self.p = p
+        self.q = q
+        self.n = p * q
+        self.d_p = d % (p - 1)
+        self.d_q = d % (q - 1)
+        self.q_inv = modinv(q % p, p)
+
+    def sign(self, r: int) -> int:
+        with SIGN_SECONDS.time(), span("sign"):
+            m1 = pow(r, self.d_p, self.p)
+            m2 = pow(r, self.d_q, self.q)
+            h = (self.q_inv * (m1 - m2)) % self.p
+            return m2 + h * self.q
+
+
+@functools.lru_cache(maxsize=16)
+def _crt_signer(p: int, q: int, d: int) -> CRTSigner:
+    return CRTSigner(p, q, d)
+
+
+# Контекст подписи строится один раз на пару ключей {"p", "q", "d", ...}
+def get_signer(keys: Dict[str, int]) -> CRTSigner:
+    return _crt_signer(keys["p"], keys["q"], keys["d"])
+
+
+# Параметры кастомной хеш-функции
+HASH_SEED = 5381
+HASH_MULTIPLIER = 0x9E3779B9
+# Размер блока (в символах), которым обрабатывается вход
+HASH_BLOCK_SIZE = 1 << 16
+_UTF32 = "utf-32-le" if sys.byteorder == "little" else "utf-32-be"
+
+
+def _code_points(block: str):
+    if block.isascii():
+        return block.encode("ascii")
+    return memoryview(block.encode(_UTF32, "surrogatepass")).cast("I")
+
+
+# Потоковый вариант custom_hash: вход можно подавать частями через update(),
+# digest() совпадает с custom_hash от конкатенации всех частей
+class CustomHasher:
+    def __init__(self, n: int):
+        self.n = n
+        self._value = HASH_SEED
+
+    def update(self, data: str) -> "CustomHasher":
+        hash_val = self._value
+        n = self.n
+        multiplier = HASH_MULTIPLIER
+        for start in range(0, len(data), HASH_BLOCK_SIZE):
+            for c in _code_points(data[start : start + HASH_BLOCK_SIZE]):
+                hash_val = (((hash_val * 33) + c) ^ (hash_val >> 8)) * multiplier % n
+        self._value = hash_val
+        return self
+
+    def digest(self) -> int:
+        return self._value % self.n
+
+
+_hash_sampled = sampler()
+
+
 # Кастомный хеш-функция для строки (возвращает значение mod n)
 def custom_hash(message: str, n: int) -> int:
-    hash_val = 5381
-    for c in message:
-        hash_val = ((hash_val * 33) + ord(c)) ^ (hash_val >> 8)
-        hash_val = (hash_val * 0x9E3779B9) % n
-    return hash_val % n
+    # Без спана и с выборочным замером: хэш вызывается на каждую подпись
+    # и проверку, и на коротких входах учёт стоил бы дороже самого хэша
+    if not _hash_sampled():
+        return CustomHasher(n).update(message).digest()
+    start = time.perf_counter()
+    digest = CustomHasher(n).update(message).digest()
+    observe_hash(len(message), time.perf_counter() - start)
+    return digest
 
 
 # Функция для унификации формирования data_str
@@ -116,3 +246,18 @@ def custom_hash(message: str, n: int) -> int:
 # Возвращает строку формата "subject|e|n|timestamp"
 def construct_data_str(subject: str, public_key: List[int], timestamp: int) -> str:
     return f"{subject}|{public_key[0]}|{public_key[1]}|{timestamp}"
+
+
+def check_key_pair(keys: Dict[str, int]) -> bool:
+    """Ключи {"p", "q", "n", "e", "d"} согласованы: n = p*q, e*d = 1 mod phi."""
+    p, q, n, e, d = (keys[name] for name in ("p", "q", "n", "e", "d"))
+    return p * q == n and e * d % ((p - 1) * (q - 1)) == 1
+
+
+def check_cert_signature(cert: dict, issuer_key: List[int]) -> bool:
+    """Подпись сертификата {"subject", "public_key", "timestamp", "signature"}."""
+    e, n = issuer_key
+    data_str = construct_data_str(
+        cert["subject"], cert["public_key"], cert["timestamp"]
+    )
+    return custom_hash(data_str, n) == pow(cert["signature"]["s"], e, n)
@@ -1,5 +1,5 @@
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
@@ -7,23 +7,50 @@ import time
 import os
 import json
 import logging
-from typing import List
-from crypto_utils import generate_keys, custom_hash, construct_data_str
+from collections import Counter
+from typing import List, Optional
+from keystore import KeyStore, KeyStoreConflict, KeyStoreLocked, passphrase_from_env
+from ledger import CertLedger
+from log_reader import read_page, resume_offset, tail
+import metrics
+import tracing
+from crypto_utils import (
+    generate_keys,
+    custom_hash,
+    construct_data_str,
+    get_signer,
+    check_key_pair,
+    check_cert_signature,
+)
 
 app = FastAPI()
+metrics.instrument(app)
+tracing.instrument(app, "root_ca")
 
 # Монтируем статические файлы и шаблоны
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
+# Каталоги
+CERT_STORE = os.getenv("CERT_STORE", "/app/cert_store")
+SIGNED_ICA_DIR = os.path.join(CERT_STORE, "signed_ica_certs")
+os.makedirs(SIGNED_ICA_DIR, exist_ok=True)
+
+# Ключи и Root-сертификат — в общем для всех воркеров хранилище:
+# {"version", "keys": {"p", "q", "n", "e", "d"}, "root_cert"}.
+# С KEYSTORE_PASSPHRASE закрытые ключи в нём зашифрованы
+keystore = KeyStore(os.path.join(CERT_STORE, "keystore.json"), passphrase_from_env())
+
 # Настройка логирования
-LOG_PATH = "/app/data/logs"
+LOG_PATH = os.getenv("LOG_PATH", "/app/data/logs")
 os.makedirs(LOG_PATH, exist_ok=True)
 log_file = os.path.join(LOG_PATH, "service.log")
 
-# Очистка лога перед запуском
-with open(log_file, "w"):
-    pass
+# Очистка лога только при холодном старте: после перезапуска с
+# сохранёнными ключами история выпуска остаётся
+if not os.path.exists(keystore.path):
+    with open(log_file, "w"):
+        pass
 
 # Настройка логгера
 logging.basicConfig(
@@ -33,14 +60,78 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S,%f",
 )
 
-# В памяти храним ключи и сертификат
-keys: dict[str, int] = {}
-root_cert: dict = {}
+# Журнал выданных сертификатов ICA
+ledger = CertLedger(os.path.join(CERT_STORE, "issued_certs.ledger"))
 
-# Каталоги
-CERT_STORE = "/app/cert_store"
-SIGNED_ICA_DIR = os.path.join(CERT_STORE, "signed_ica_certs")
-os.makedirs(SIGNED_ICA_DIR, exist_ok=True)
+
+def import_legacy_certs():
+    # Сертификаты, выданные до появления журнала, лежат по файлу на subject
+    if len(ledger):
+        return
+    paths = [
+        os.path.join(SIGNED_ICA_DIR, name)
+        for name in os.listdir(SIGNED_ICA_DIR)
+        if name.endswith(".json")
+    ]
+    entries = []
+    for path in sorted(paths, key=os.path.getmtime):
+        with open(path, "r") as f:
+            cert = json.load(f)
+        entries.append((cert, cert["public_key"]))
+    # Другой воркер мог перенести их, пока читались файлы
+    if entries and ledger.import_if_empty(entries):
+        logging.info(f"В журнал перенесено сертификатов: {len(entries)}")
+
+
+import_legacy_certs()
+
+
+def warm_start() -> bool:
+    """Поднимает ключи и Root-сертификат из хранилища, проверив их один раз.
+
+    Несогласованные ключи убираются в сторону, и УЦ стартует пустым, как
+    раньше; Root-сертификат, не подходящий к ключам, сбрасывается. Ключи,
+    зашифрованные другим паролем или без пароля, — ошибка запуска.
+    """
+    started = time.perf_counter()
+    try:
+        state = keystore.load()
+    except KeyStoreLocked as e:
+        logging.critical(f"Хранилище ключей не открыто: {e}")
+        raise
+    keys, root_cert = state.get("keys"), state.get("root_cert")
+    if not keys:
+        logging.info("Холодный старт: ключей в хранилище нет")
+        return False
+    if not check_key_pair(keys):
+        target = keystore.discard("ключи не согласованы")
+        logging.error(f"Ключи в хранилище не согласованы, файл перемещён в {target}")
+        return False
+    if root_cert and not (
+        root_cert["public_key"] == [keys["e"], keys["n"]]
+        and check_cert_signature(root_cert, root_cert["public_key"])
+    ):
+        logging.error("Root-сертификат в хранилище не подходит к ключам, сброшен")
+        keystore.update({"root_cert": None})
+        root_cert = None
+    if keystore.encrypted and keystore.plaintext_secrets:
+        # Пароль задан впервые — перезаписываем ключи зашифрованными
+        keystore.update({})
+        logging.info("Ключи в хранилище зашифрованы паролем")
+    if root_cert:
+        path = os.path.join(CERT_STORE, "root_cert.json")
+        if not os.path.exists(path):
+            with open(path, "w") as f:
+                json.dump(root_cert, f, indent=2)
+    elapsed = (time.perf_counter() - started) * 1000
+    logging.info(
+        f"Тёплый старт: ключи{' и Root-сертификат' if root_cert else ''} "
+        f"загружены из хранилища за {elapsed:.1f} мс"
+    )
+    return True
+
+
+warm_start()
 
 
 # Модель CSR-запроса
@@ -58,13 +149,18 @@ def index(request: Request):
 @app.post("/generate_keys")
 def generate_keys_endpoint():
     p, q, n, e, d = generate_keys()
-    keys.update({"p": p, "q": q, "n": n, "e": e, "d": d})
+    # Root-сертификат старого ключа сбрасывается вместе с ним
+    keystore.update(
+        {"keys": {"p": p, "q": q, "n": n, "e": e, "d": d}, "root_cert": None}
+    )
     logging.info(f"Сгенерированы ключи RSA: p={p}, q={q}, n={n}, e={e}, d={d}")
     return {"public_key": [e, n], "private_key": d}
 
 
 @app.post("/issue_root_cert")
 def issue_root_cert():
+    state = keystore.load()
+    keys = state.get("keys")
     if not keys:
         raise HTTPException(status_code=400, detail="Сначала вызовите /generate_keys")
     subject = "Root CA"
@@ -73,18 +169,21 @@ def issue_root_cert():
 
     data_str = construct_data_str(subject, public_key, timestamp)
     r = custom_hash(data_str, keys["n"])
-    s = pow(r, keys["d"], keys["n"])
-
-    root_cert.clear()
-    root_cert.update(
-        {
-            "subject": subject,
-            "issuer": subject,
-            "public_key": public_key,
-            "timestamp": timestamp,
-            "signature": {"r": r, "s": s},
-        }
-    )
+    s = get_signer(keys).sign(r)
+
+    root_cert = {
+        "subject": subject,
+        "issuer": subject,
+        "public_key": public_key,
+        "timestamp": timestamp,
+        "signature": {"r": r, "s": s},
+    }
+    try:
+        keystore.update({"root_cert": root_cert}, expected_version=state["version"])
+    except KeyStoreConflict:
+        raise HTTPException(
+            status_code=409, detail="Ключи сменились во время выпуска, повторите"
+        )
 
     path = os.path.join(CERT_STORE, "root_cert.json")
     with open(path, "w") as f:
@@ -98,26 +197,21 @@ def issue_root_cert():
 
 @app.get("/send_root_cert")
 def send_root_cert():
+    root_cert = keystore.load().get("root_cert")
     if not root_cert:
         raise HTTPException(status_code=404, detail="Root certificate not issued yet")
     logging.info(f"Отправлен Root Certificate: subject={root_cert['subject']}")
     return root_cert
 
 
-@app.post("/sign_ica_cert")
-def sign_ica_cert(req: ICACertRequest):
-    if not keys:
-        raise HTTPException(
-            status_code=400, detail="Сначала вызовите /generate_keys и /issue_root_cert"
-        )
-    if not root_cert:
-        raise HTTPException(status_code=400, detail="Сертификат Root CA не выпущен")
-
+def sign_csr(req: ICACertRequest, state: dict) -> dict:
+    # Ключи и сертификат берутся из одного снимка хранилища
+    keys, root_cert = state["keys"], state["root_cert"]
     data_str = construct_data_str(req.subject, req.public_key, req.timestamp)
     r = custom_hash(data_str, keys["n"])
-    s = pow(r, keys["d"], keys["n"])
+    s = get_signer(keys).sign(r)
 
-    signed_cert = {
+    return {
         "subject": req.subject,
         "issuer": root_cert["subject"],
         "public_key": req.public_key,
@@ -126,25 +220,100 @@ def sign_ica_cert(req: ICACertRequest):
         "signature": {"r": r, "s": s},
     }
 
-    filename = f"{req.subject.replace(' ', '_')}.json"
-    path = os.path.join(SIGNED_ICA_DIR, filename)
-    with open(path, "w") as f:
-        json.dump(signed_cert, f, indent=2)
 
+# Дописывает подписанные сертификаты в журнал одной записью после подписи
+# всего набора и проставляет им serial
+def save_signed_certs(signed_certs: List[dict]) -> None:
+    records = ledger.append_many(
+        [(signed_cert, signed_cert["public_key"]) for signed_cert in signed_certs]
+    )
+    for signed_cert, record in zip(signed_certs, records):
+        signed_cert["serial"] = record["serial"]
+
+
+def require_root_ca() -> dict:
+    state = keystore.load()
+    if not state.get("keys"):
+        raise HTTPException(
+            status_code=400, detail="Сначала вызовите /generate_keys и /issue_root_cert"
+        )
+    if not state.get("root_cert"):
+        raise HTTPException(status_code=400, detail="Сертификат Root CA не выпущен")
+    return state
+
+
+@app.post("/sign_ica_cert")
+def sign_ica_cert(req: ICACertRequest):
+    state = require_root_ca()
+    signed_cert = sign_csr(req, state)
+    save_signed_certs([signed_cert])
+
+    r, s = signed_cert["signature"]["r"], signed_cert["signature"]["s"]
     logging.info(
-        f"Подписан сертификат для '{req.subject}': public_key={req.public_key}, public_key_c={root_cert['public_key']}, timestamp={req.timestamp}, r={r}, s={s}"
+        f"Подписан сертификат для '{req.subject}': public_key={req.public_key}, public_key_c={state['root_cert']['public_key']}, timestamp={req.timestamp}, r={r}, s={s}"
     )
     return signed_cert
 
 
+@app.post("/sign_ica_certs")
+def sign_ica_certs(reqs: List[ICACertRequest]):
+    # Два запроса на один subject в наборе — скорее всего ошибка вызывающего:
+    # какой из сертификатов считать действующим, неизвестно
+    counts = Counter(req.subject for req in reqs)
+    duplicates = sorted(subject for subject, count in counts.items() if count > 1)
+    if duplicates:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Повторяющиеся subject в наборе: {', '.join(duplicates)}",
+        )
+    state = require_root_ca()
+    signed_certs = [sign_csr(req, state) for req in reqs]
+    save_signed_certs(signed_certs)
+
+    subjects = ", ".join(f"'{req.subject}'" for req in reqs)
+    logging.info(f"Подписано сертификатов: {len(signed_certs)} ({subjects})")
+    return signed_certs
+
+
+@app.get("/issued_certs")
+def issued_certs(subject: Optional[str] = None, fingerprint: Optional[str] = None):
+    # История выпусков по subject или по отпечатку открытого ключа
+    if subject is not None:
+        return ledger.history(subject)
+    if fingerprint is not None:
+        return ledger.by_fingerprint(fingerprint)
+    raise HTTPException(status_code=400, detail="Укажите subject или fingerprint")
+
+
+@app.get("/issued_certs/{serial}")
+def issued_cert(serial: int):
+    record = ledger.by_serial(serial)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Сертификат не найден")
+    return record
+
+
 @app.get("/get_logs")
-def get_logs():
-    # Читаем весь лог и отдаём без временных меток
-    lines = []
-    with open(log_file, "r", encoding="utf-8") as f:
-        for line in f:
-            # Убираем всё до ']' (включительно)
-            if "]" in line:
-                text = line.split("] ", 1)[1].rstrip()
-                lines.append(text)
-    return JSONResponse(lines)
+def get_logs(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=10000),
+    since: Optional[float] = None,
+):
+    # Страница лога без временных меток; курсор следующей страницы — в X-Next-Offset
+    lines, next_offset = read_page(log_file, offset, limit, since)
+    return JSONResponse(lines, headers={"X-Next-Offset": str(next_offset)})
+
+
+@app.get("/get_logs/stream")
+async def stream_logs(request: Request, offset: Optional[int] = Query(None, ge=0)):
+    # Без offset и Last-Event-ID отдаются только строки, появившиеся после
+    # подключения
+    if offset is None:
+        offset = resume_offset(
+            request.headers.get("last-event-id"), os.path.getsize(log_file)
+        )
+    return StreamingResponse(
+        tail(log_file, offset, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )